@@ -0,0 +1,138 @@
+import json
+import os
+import time
+from statistics import median
+
+from selenium.common.exceptions import ScriptTimeoutException, TimeoutException
+
+# JavaScript run with execute_async_script: resolves as soon as the page shows product
+# cards, a "no results"/block page, or the network has gone idle after the load event
+READY_SCRIPT = """
+var productSelector = arguments[0];
+var emptyPatterns = arguments[1];
+var blockPatterns = arguments[2];
+var idleMs = arguments[3];
+var blockSelector = arguments[4];
+var done = arguments[arguments.length - 1];
+var finished = false;
+var lastActivity = Date.now();
+
+function textMatches(patterns) {
+    var text = (document.body && document.body.innerText || '').toLowerCase();
+    for (var i = 0; i < patterns.length; i++) {
+        if (text.indexOf(patterns[i]) !== -1) { return true; }
+    }
+    return false;
+}
+
+function check() {
+    if (finished) { return; }
+    var state = null;
+    var complete = document.readyState === 'complete';
+    if (document.querySelector(productSelector)) { state = 'products'; }
+    else if (document.querySelector(blockSelector)) { state = 'blocked'; }
+    // Page text is only trusted once the document has loaded, before the cards can still show up
+    else if (complete && textMatches(blockPatterns)) { state = 'blocked'; }
+    else if (complete && textMatches(emptyPatterns)) { state = 'empty'; }
+    else if (complete && Date.now() - lastActivity >= idleMs) { state = 'idle'; }
+    if (state) {
+        finished = true;
+        observer.disconnect();
+        if (resourceObserver) { resourceObserver.disconnect(); }
+        clearInterval(timer);
+        done(state);
+    }
+}
+
+var observer = new MutationObserver(function() { lastActivity = Date.now(); check(); });
+observer.observe(document.documentElement, {childList: true, subtree: true});
+
+// Any new network request counts as activity for the idle detection
+var resourceObserver = null;
+if (window.PerformanceObserver) {
+    resourceObserver = new PerformanceObserver(function() { lastActivity = Date.now(); });
+    resourceObserver.observe({entryTypes: ['resource']});
+}
+
+var timer = setInterval(check, 100);
+check();
+"""
+
+# Page texts that mean there is nothing to wait for
+EMPTY_PATTERNS = ['nenhum resultado', 'não encontramos', 'nao encontramos', 'sem resultados']
+# 'captcha' alone is not a block: many pages carry a "protegido por reCAPTCHA" footer
+BLOCK_PATTERNS = ['access denied', 'acesso negado', 'verifique que você é humano', 'request blocked']
+# Captcha challenges (not the invisible reCAPTCHA badge) and bot-check interstitials
+BLOCK_SELECTOR = ("iframe[src*='recaptcha/api2/bframe'], iframe[src*='recaptcha/enterprise/bframe'], "
+                  "iframe[src*='hcaptcha.com'][src*='frame=challenge'], #challenge-form, #cf-challenge-running, "
+                  "iframe[src*='challenges.cloudflare.com']")
+
+
+class LoadTimeHistory:
+    """Recorded page load times per store, used to size wait timeouts"""
+
+    def __init__(self, filename='tempos_carregamento.json', max_samples=50,
+                 default_timeout=10.0, min_timeout=3.0, max_timeout=45.0):
+        self.filename = filename
+        self.max_samples = max_samples
+        self.default_timeout = default_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.samples = {}
+        self.load()
+
+    def load(self):
+        """Load previously recorded load times"""
+        if not os.path.exists(self.filename):
+            return
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as f:
+                self.samples = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not read load time history {self.filename}: {e}")
+            self.samples = {}
+
+    def save(self):
+        """Persist the recorded load times"""
+        with open(self.filename, 'w', encoding='utf-8') as f:
+            json.dump(self.samples, f, indent=2)
+
+    def record(self, store, seconds):
+        """Record a page load time for a store"""
+        samples = self.samples.setdefault(store, [])
+        samples.append(round(seconds, 3))
+        # Keep only the most recent samples so the timeout follows the site's current speed
+        del samples[:-self.max_samples]
+
+    def timeout_for(self, store):
+        """Return a timeout for the store based on its slowest recent loads"""
+        samples = self.samples.get(store)
+        if not samples:
+            return self.default_timeout
+        ordered = sorted(samples)
+        p90 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))]
+        # Leave room for slow loads: twice the 90th percentile, never below the median plus margin
+        timeout = max(p90 * 2, median(ordered) + self.min_timeout)
+        return min(max(timeout, self.min_timeout), self.max_timeout)
+
+
+def wait_for_page_ready(driver, product_selector, store, history, idle_ms=1500):
+    """Wait until the page is ready and return its state ('products', 'empty', 'blocked', 'idle' or 'timeout')"""
+    timeout = history.timeout_for(store)
+    start = time.time()
+    driver.set_script_timeout(timeout)
+    try:
+        state = driver.execute_async_script(READY_SCRIPT, product_selector, EMPTY_PATTERNS, BLOCK_PATTERNS,
+                                            idle_ms, BLOCK_SELECTOR)
+    except (ScriptTimeoutException, TimeoutException):
+        # The page never became ready; other WebDriver errors (e.g. a navigation during the
+        # wait) are not timeouts and propagate. The load
+        # took at least the whole timeout, so record that much and the next timeout grows
+        history.record(store, timeout)
+        return 'timeout'
+
+    elapsed = time.time() - start
+    # Only pages that actually rendered products tell us how long a real load takes
+    if state == 'products':
+        history.record(store, elapsed)
+    return state
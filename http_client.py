@@ -0,0 +1,94 @@
+import importlib.util
+
+import requests
+
+from replay import transport
+
+# Headers that only make sense on HTTP/1.1 and are rejected by HTTP/2 servers
+HOP_BY_HOP_HEADERS = {'connection', 'keep-alive', 'proxy-connection', 'transfer-encoding', 'upgrade'}
+
+CHUNK_SIZE = 64 * 1024
+
+
+def supported_encodings(http2=False):
+    """Content encodings the selected client (httpx or requests/urllib3) can actually decode"""
+    # Brotli and Zstandard also depend on the library version (urllib3 1.26 ignores zstandard
+    # even when it is installed), so ask the library instead of looking for the packages
+    if http2:
+        try:
+            from httpx._decoders import SUPPORTED_DECODERS
+        except (ImportError, AttributeError):
+            # Private to httpx; if it moves, offer only what httpx's optional extras provide
+            encodings = ['gzip', 'deflate']
+            if importlib.util.find_spec('brotli') or importlib.util.find_spec('brotlicffi'):
+                encodings.append('br')
+            if importlib.util.find_spec('zstandard'):
+                encodings.append('zstd')
+            return encodings
+        return [name for name in SUPPORTED_DECODERS if name != 'identity']
+    from urllib3.util.request import ACCEPT_ENCODING
+
+    return ACCEPT_ENCODING.split(',')
+
+
+def http2_available():
+    """True if httpx and its HTTP/2 support (h2) are installed"""
+    return bool(importlib.util.find_spec('httpx') and importlib.util.find_spec('h2'))
+
+
+class HttpClient:
+    """HTTP client for the requests-based scrapers (errors are raised as requests.RequestException)"""
+
+    def __init__(self, headers, http2=True, timeout=30):
+        # With httpx + h2 every query and page to the same host is multiplexed over one
+        # HTTP/2 connection; otherwise fall back to a keep-alive requests.Session
+        self.timeout = timeout
+        self.http2 = http2 and http2_available()
+        headers = dict(headers)
+        headers['Accept-Encoding'] = ', '.join(supported_encodings(self.http2))
+        if self.http2:
+            import httpx
+
+            headers = {k: v for k, v in headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+            self.client = httpx.Client(http2=True, headers=headers, timeout=timeout, follow_redirects=True)
+        else:
+            self.client = requests.Session()
+            self.client.headers.update(headers)
+
+    @property
+    def headers(self):
+        return self.client.headers
+
+    def get_content(self, url):
+        """Download a page and return its decompressed body as bytes"""
+        if transport.replaying:
+            body = transport.archive.get(url)
+            if body is None:
+                raise requests.RequestException(f"{url} is not in the replay archive")
+            return body
+        
+        # Decompressed chunks are collected straight into one buffer, skipping the
+        # intermediate str that response.text would build (and its charset detection)
+        body = bytearray()
+        if self.http2:
+            import httpx
+
+            try:
+                with self.client.stream('GET', url) as response:
+                    response.raise_for_status()
+                    for chunk in response.iter_bytes(CHUNK_SIZE):
+                        body += chunk
+            except httpx.HTTPError as e:
+                raise requests.RequestException(str(e)) from e
+        else:
+            with self.client.get(url, stream=True, timeout=self.timeout) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    body += chunk
+        body = bytes(body)
+        if transport.recording:
+            transport.archive.put(url, body)
+        return body
+
+    def close(self):
+        self.client.close()
@@ -1,23 +1,44 @@
+import sys
 import time
-import csv
 import json
-from datetime import datetime
 import random
 import re
 from urllib.parse import quote
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import NoSuchElementException
 from bs4 import BeautifulSoup
+from adaptive_wait import LoadTimeHistory, wait_for_page_ready
+from offer import Offer, parse_price_cents, write_csv, write_json
+from product_verification import ProductVerifier, is_target_model, verify_offers
+from profiling import profile_requested, profiler
+from replay import transport
+
+# Product card selectors used to detect that the listing has rendered
+PRODUCT_CARD_SELECTOR = "[data-testid='product-card'], .product-card, .minigallery-item, .gallery-item"
+
+# URL fragments of the JSON endpoints the Kabum search page calls to fill its listing
+PRODUCT_API_PATTERNS = ['/catalog/v2/products', '/catalog/v2/search', '/catalog/products', 'api.aws.grupokabum.com.br']
+
+# Once the cards have rendered the listing response has normally arrived; only wait this long for it
+NETWORK_GRACE_SECONDS = 2
+
 
 class KabumScraper:
-    def __init__(self):
-        # Setup Chrome options for anti-detection
+    def __init__(self, capture_network=False, verifier=None):
+        # When enabled, products are read from the XHR JSON responses captured through
+        # Chrome's performance log instead of re-parsing the rendered DOM
+        self.capture_network = capture_network
+        # Optional ProductVerifier checking titles without specs against their product page
+        self.verifier = verifier
+        # Historical load times used to size the page waits
+        self.load_history = LoadTimeHistory()
+        # Readiness state of the last loaded page ('products', 'empty', 'blocked', 'idle' or 'timeout')
+        self.last_page_state = None
+        # Setup Chrome options for anti-detection (no browser is needed when replaying)
         self.driver = None
-        self.setup_driver()
+        if not transport.replaying:
+            self.setup_driver()
 
     def setup_driver(self):
         """Setup Chrome driver with options to bypass anti-bot measures"""
@@ -49,6 +70,10 @@ class KabumScraper:
         chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
         chrome_options.add_experimental_option('useAutomationExtension', False)
         
+        # Enable network events in the performance log so XHR responses can be captured
+        if self.capture_network:
+            chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+        
         from webdriver_manager.chrome import ChromeDriverManager
         from selenium.webdriver.chrome.service import Service
         
@@ -57,6 +82,9 @@ class KabumScraper:
         
         # Execute script to remove webdriver property
         self.driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+        
+        if self.capture_network:
+            self.driver.execute_cdp_cmd('Network.enable', {})
 
     def scrape_products(self):
         """Scrape products from Kabum using Selenium to handle JavaScript"""
@@ -67,84 +95,291 @@ class KabumScraper:
         
         products = []
         
-        for term in search_terms:
+        for i, term in enumerate(search_terms):
             print(f"Tentando busca com: {term}")
             
-            # Random delay to simulate human behavior
-            time.sleep(random.uniform(3, 7))
+            # Random delay between searches to simulate human behavior
+            if i > 0 and not transport.replaying:
+                time.sleep(random.uniform(3, 7))
             
             try:
-                # Navigate to search page
-                search_url = f"https://www.kabum.com.br/busca/{quote(term)}"
-                self.driver.get(search_url)
-                
-                # Wait for page to load completely
-                WebDriverWait(self.driver, 15).until(
-                    EC.presence_of_element_located((By.TAG_NAME, "body"))
-                )
-                
-                # Wait for products to load (look for product containers)
-                try:
-                    # Wait for product containers to be present
-                    WebDriverWait(self.driver, 10).until(
-                        EC.presence_of_element_located((By.CSS_SELECTOR, "[data-testid='product-card'], .product-card, .minigallery-item, .gallery-item"))
-                    )
-                except TimeoutException:
-                    print("Products may not have loaded in time, continue with available content")
-                
-                # Get the page source after JavaScript execution
-                page_source = self.driver.page_source
-                soup = BeautifulSoup(page_source, 'html.parser')
-                
-                # Look for product containers with multiple selector approaches
-                selectors = [
-                    '[data-testid="product-card"]',
-                    '[data-testid="product-card-item"]',
-                    '.product-card',
-                    '.product-card-wrapper', 
-                    '.minigallery-item',
-                    '.gallery-item',
-                    'article',
-                    # Additional selectors that might work
-                    '[class*="product"]',
-                    '[class*="Produto"]',
-                    '[class*="produto"]',
-                    '[class*="item"]',
-                    '[class*="card"]'
-                ]
-                
-                product_containers = []
-                for selector in selectors:
-                    elements = soup.select(selector)
-                    if elements:
-                        product_containers = elements
-                        print(f"Found {len(elements)} elements with selector: {selector}")
-                        break
-                
-                # If still no containers, try a more general approach
-                if not product_containers:
-                    product_containers = soup.find_all(['div', 'article'], attrs={'data-testid': True})
-                
-                # If still no containers, try to find anything that might be a product
-                if not product_containers:
-                    product_containers = soup.find_all(['div', 'article'], class_=re.compile(r'product|card|item|produto'))
-                
-                # Extract product info from each container
-                for container in product_containers:
-                    product = self.extract_product_info(container)
-                    if product:
-                        products.append(product)
-                
-                # If we found products, break out of the loop
-                if products:
-                    break
-                    
+                products = self.scrape_term(term)
             except Exception as e:
                 print(f"Error processing Kabum page for term {term}: {e}")
                 continue
+            
+            if self.last_page_state == 'blocked':
+                print("Kabum returned a block page, stopping search")
+                break
+            
+            # If we found products, break out of the loop
+            if products:
+                break
         
         return products
 
+    def scrape_term(self, term, page=1):
+        """Scrape one page of Kabum search results for a term"""
+        search_url = f"https://www.kabum.com.br/busca/{quote(term)}"
+        if page > 1:
+            search_url += f"?page_number={page}"
+        if transport.replaying:
+            return self.replay_term(search_url)
+        
+        # Discard log entries left over from the previous page
+        if self.capture_network:
+            self.driver.get_log('performance')
+        
+        # Navigate to search page
+        with profiler.phase('Kabum', 'navigation'):
+            self.driver.get(search_url)
+            
+            # Wait for product cards, an empty/block page or network idle, whichever comes first
+            self.last_page_state = wait_for_page_ready(self.driver, PRODUCT_CARD_SELECTOR, 'Kabum', self.load_history)
+        if transport.recording:
+            transport.archive.put('state:' + search_url, self.last_page_state)
+        if self.last_page_state == 'blocked':
+            return []
+        if self.last_page_state == 'empty':
+            print("No results for this term")
+            return []
+        if self.last_page_state == 'timeout':
+            print("Products may not have loaded in time, continue with available content")
+        
+        # Read products straight from the listing API responses, skipping the DOM
+        if self.capture_network:
+            if self.last_page_state == 'products':
+                timeout = NETWORK_GRACE_SECONDS
+            else:
+                timeout = self.load_history.timeout_for('Kabum')
+            with profiler.phase('Kabum', 'network_capture'):
+                products = self.scrape_products_from_network(search_url, timeout=timeout)
+            if products:
+                print(f"Found {len(products)} products in captured API responses")
+                return verify_offers(self.verifier, products, 'Kabum', keep_unknown=True)
+            print("No product API response captured, falling back to page source")
+        
+        # Get the page source after JavaScript execution
+        with profiler.phase('Kabum', 'page_source'):
+            page_source = self.driver.page_source
+        if transport.recording:
+            transport.archive.put('page_source:' + search_url, page_source)
+        return self.parse_page_source(page_source)
+
+    def replay_term(self, search_url):
+        """Serve a search page recorded with --record instead of loading it in the browser"""
+        state = transport.archive.get('state:' + search_url)
+        if state is None:
+            raise ValueError(f"{search_url} is not in the replay archive")
+        self.last_page_state = state.decode('utf-8')
+        if self.last_page_state in ('blocked', 'empty'):
+            return []
+        
+        if self.capture_network:
+            products = self.extract_products_from_payloads(transport.archive.get_json('xhr:' + search_url) or [])
+            if products:
+                return verify_offers(self.verifier, products, 'Kabum', keep_unknown=True)
+        
+        page_source = transport.archive.get('page_source:' + search_url)
+        if page_source is None:
+            return []
+        return self.parse_page_source(page_source.decode('utf-8'))
+
+    def parse_page_source(self, page_source):
+        """Parse the rendered page source and extract its products"""
+        with profiler.phase('Kabum', 'parse'):
+            soup = BeautifulSoup(page_source, 'html.parser')
+        with profiler.phase('Kabum', 'extract'):
+            products = self.extract_products(soup)
+        # Kabum has always kept listings without specs, so pages that cannot be read keep them too
+        return verify_offers(self.verifier, products, 'Kabum', keep_unknown=True)
+
+    def extract_products(self, soup):
+        """Find product containers in a parsed search page and extract their products"""
+        # Look for product containers with multiple selector approaches
+        selectors = [
+            '[data-testid="product-card"]',
+            '[data-testid="product-card-item"]',
+            '.product-card',
+            '.product-card-wrapper', 
+            '.minigallery-item',
+            '.gallery-item',
+            'article',
+            # Additional selectors that might work
+            '[class*="product"]',
+            '[class*="Produto"]',
+            '[class*="produto"]',
+            '[class*="item"]',
+            '[class*="card"]'
+        ]
+        
+        product_containers = []
+        for selector in selectors:
+            elements = soup.select(selector)
+            if elements:
+                product_containers = elements
+                print(f"Found {len(elements)} elements with selector: {selector}")
+                break
+        
+        # If still no containers, try a more general approach
+        if not product_containers:
+            product_containers = soup.find_all(['div', 'article'], attrs={'data-testid': True})
+        
+        # If still no containers, try to find anything that might be a product
+        if not product_containers:
+            product_containers = soup.find_all(['div', 'article'], class_=re.compile(r'product|card|item|produto'))
+        
+        # Extract product info from each container
+        products = []
+        for container in product_containers:
+            product = self.extract_product_info(container)
+            if product:
+                products.append(product)
+        
+        return products
+
+    def scrape_products_from_network(self, search_url, timeout=10):
+        """Extract products from the JSON responses captured in the performance log"""
+        products = []
+        payloads = []
+        # Listing responses whose body has not been read yet, and requests that finished loading
+        pending_requests = set()
+        finished_requests = set()
+        deadline = time.time() + timeout
+        
+        # Poll the log until a listing response shows up or the timeout expires
+        while time.time() < deadline:
+            responses, finished = self.get_product_api_responses()
+            pending_requests.update(responses)
+            finished_requests.update(finished)
+            
+            # The body is only complete after Network.loadingFinished for that request
+            for request_id in list(pending_requests & finished_requests):
+                try:
+                    body = self.driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': request_id})
+                except Exception as e:
+                    # Left pending, so the next poll tries again
+                    print(f"Could not read Kabum API response body: {e}")
+                    continue
+                pending_requests.discard(request_id)
+                
+                try:
+                    payload = json.loads(body.get('body', ''))
+                except ValueError:
+                    continue
+                
+                payloads.append(payload)
+                products.extend(self.extract_products_from_payloads([payload]))
+            
+            if products:
+                break
+            time.sleep(0.5)
+        
+        if transport.recording:
+            transport.archive.put_json('xhr:' + search_url, payloads)
+        return products
+
+    def extract_products_from_payloads(self, payloads):
+        """Extract products from decoded listing API responses"""
+        products = []
+        for payload in payloads:
+            for item in self.find_product_items(payload):
+                product = self.extract_product_from_json(item)
+                if product:
+                    products.append(product)
+        return products
+
+    def get_product_api_responses(self):
+        """Read the performance log and return (listing API response ids, ids of requests that finished loading)"""
+        request_ids = []
+        finished_ids = []
+        for entry in self.driver.get_log('performance'):
+            try:
+                message = json.loads(entry['message'])['message']
+            except (KeyError, ValueError):
+                continue
+            
+            method = message.get('method')
+            if method == 'Network.loadingFinished':
+                finished_ids.append(message['params']['requestId'])
+                continue
+            if method != 'Network.responseReceived':
+                continue
+            
+            response = message['params']['response']
+            if 'json' not in response.get('mimeType', ''):
+                continue
+            if any(pattern in response.get('url', '') for pattern in PRODUCT_API_PATTERNS):
+                request_ids.append(message['params']['requestId'])
+        
+        return request_ids, finished_ids
+
+    def find_product_items(self, payload):
+        """Walk a JSON payload and yield every object that looks like a product"""
+        if isinstance(payload, list):
+            for value in payload:
+                yield from self.find_product_items(value)
+        elif isinstance(payload, dict):
+            # JSON:API style entries keep the product fields under "attributes"
+            fields = payload.get('attributes') if isinstance(payload.get('attributes'), dict) else payload
+            if any(key in fields for key in ('title', 'name', 'nome')) and any('price' in key or 'preco' in key for key in fields):
+                yield payload
+                return
+            for value in payload.values():
+                if isinstance(value, (dict, list)):
+                    yield from self.find_product_items(value)
+
+    def extract_product_from_json(self, item):
+        """Extract product info from a product object of the Kabum listing API"""
+        try:
+            fields = item.get('attributes') if isinstance(item.get('attributes'), dict) else item
+            title = str(fields.get('title') or fields.get('name') or fields.get('nome') or "Título não encontrado")
+            
+            # Prefer the discounted (cash) price, then any offer price, then the list price
+            price_value = None
+            offer = fields.get('offer') if isinstance(fields.get('offer'), dict) else {}
+            for key in ('price_with_discount', 'priceWithDiscount', 'vlr_oferta'):
+                price_value = offer.get(key) or fields.get(key)
+                if price_value:
+                    break
+            if not price_value:
+                price_value = fields.get('price') or fields.get('preco') or offer.get('price')
+            
+            # The API gives prices in reais, as numbers or as plain numeric strings ("899.90");
+            # only text such as "R$ 1.099,90" uses the Brazilian separators
+            price_cents = None
+            if isinstance(price_value, (int, float)):
+                price_cents = round(price_value * 100)
+            elif price_value:
+                try:
+                    price_cents = round(float(str(price_value)) * 100)
+                except ValueError:
+                    price_cents = parse_price_cents(str(price_value))
+            
+            # Build the product link from the code and friendly name when no URL is given
+            link = fields.get('link') or fields.get('url') or "Link não encontrado"
+            code = item.get('id') or fields.get('code') or fields.get('codigo')
+            friendly_name = fields.get('friendly_name') or fields.get('friendlyName')
+            if link == "Link não encontrado" and code:
+                link = f"https://www.kabum.com.br/produto/{code}"
+                if friendly_name:
+                    link += f"/{friendly_name}"
+            elif link.startswith('/'):
+                link = 'https://www.kabum.com.br' + link
+            
+            if self.matches_target(title):
+                return Offer(title, price_cents, link, 'Kabum')
+        
+        except Exception as e:
+            print(f"Error extracting Kabum product from API response: {e}")
+            return None
+        
+        return None
+
+    def matches_target(self, title):
+        """Check if a title is a new Samsung Galaxy A05s (specs may be missing from the title)"""
+        return 'samsung' in title.lower() and is_target_model(title)
+
     def extract_product_info(self, container):
         """Extract product info from Kabum"""
         try:
@@ -250,28 +485,10 @@ class KabumScraper:
                 'recond' not in title_lower and
                 'usado' not in title_lower and
                 'segunda m' not in title_lower):
-                return {
-                    'title': title,
-                    'price': price,
-                    'link': link,
-                    'store': 'Kabum',
-                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
+                return Offer(title, parse_price_cents(price), link, 'Kabum')
             # More permissive check in case specifications aren't in title
-            elif ('galaxy' in title_lower and 
-                  'a05s' in title_lower and 
-                  'samsung' in title_lower and
-                  'recondicionado' not in title_lower and
-                  'recond' not in title_lower and
-                  'usado' not in title_lower and
-                  'segunda m' not in title_lower):
-                return {
-                    'title': title,
-                    'price': price,
-                    'link': link,
-                    'store': 'Kabum',
-                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
+            elif self.matches_target(title):
+                return Offer(title, parse_price_cents(price), link, 'Kabum')
         
         except Exception as e:
             print(f"Error extracting Kabum product info: {e}")
@@ -292,11 +509,11 @@ class KabumScraper:
         print("-" * 100)
         
         for i, product in enumerate(top_5_products, 1):
-            print(f"{i}. {product['title']}")
-            print(f"   Preço: {product['price']}")
-            print(f"   Loja: {product['store']}")
-            print(f"   Link: {product['link']}")
-            print(f"   Data/Hora: {product['timestamp']}")
+            print(f"{i}. {product.title}")
+            print(f"   Preço: {product.price}")
+            print(f"   Loja: {product.store}")
+            print(f"   Link: {product.link}")
+            print(f"   Data/Hora: {product.formatted_timestamp}")
             print("-" * 100)
 
     def save_results(self, products, filename='precos_kabum_galaxy_a05s.csv'):
@@ -304,24 +521,28 @@ class KabumScraper:
         # Limit to top 5 products
         top_5_products = products[:5] if len(products) > 5 else products
         
-        with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['title', 'price', 'link', 'store', 'timestamp']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            
-            writer.writeheader()
-            for product in top_5_products:
-                writer.writerow(product)
+        write_csv(top_5_products, filename)
         
         print(f"Resultados salvos em {filename}")
 
     def close(self):
-        """Close the selenium driver"""
+        """Close the selenium driver and keep the load times measured by this scraper"""
         if self.driver:
             self.driver.quit()
+        self.load_history.save()
 
 
 def main():
-    scraper = KabumScraper()
+    # Pass --profile to write CPU/memory profiles of each phase to perfis/
+    if profile_requested():
+        profiler.enable()
+    # Pass --record FILE to archive every page, or --replay FILE to run offline from one
+    transport.configure_from_argv()
+    
+    # Pass --network to read products from the captured API responses, and --verify
+    # to check listings without specs in the title against their product page
+    verifier = ProductVerifier() if '--verify' in sys.argv else None
+    scraper = KabumScraper(capture_network='--network' in sys.argv, verifier=verifier)
     
     print("Iniciando monitoramento de preços do Samsung Galaxy A05s na Kabum...")
     print("Este processo pode levar alguns minutos.\n")
@@ -331,17 +552,20 @@ def main():
     scraper.print_results(products)
     
     if products:
-        scraper.save_results(products)
-        
-        # Also save to JSON for additional format
-        with open('precos_kabum_galaxy_a05s.json', 'w', encoding='utf-8') as jsonfile:
-            json.dump(products, jsonfile, ensure_ascii=False, indent=2)
+        with profiler.phase('Kabum', 'output'):
+            # Replayed results go next to the archive instead of over the live files
+            scraper.save_results(products, transport.output_path('precos_kabum_galaxy_a05s.csv'))
+            
+            # Also save to JSON for additional format
+            json_file = transport.output_path('precos_kabum_galaxy_a05s.json')
+            write_json(products, json_file)
         
-        print("\nDados também salvos em precos_kabum_galaxy_a05s.json")
+        print(f"\nDados também salvos em {json_file}")
     else:
         print("\nNenhum produto correspondente encontrado na Kabum.")
     
     scraper.close()
+    profiler.write_reports()
 
 
 if __name__ == "__main__":
@@ -1,21 +1,22 @@
+import sys
 import requests
 from bs4 import BeautifulSoup
 import time
-import csv
-import json
-from datetime import datetime
 import random
 import re
+from http_client import HttpClient
+from offer import Offer, parse_price_cents, write_csv, write_json
+from product_verification import ProductVerifier, is_target_model, title_is_ambiguous, verify_offers
+from profiling import profile_requested, profiler
+from replay import transport
 
 class MagazineLuizaScraper:
-    def __init__(self):
-        self.session = requests.Session()
+    def __init__(self, verifier=None):
         # Enhanced headers to mimic a real browser more closely
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
             'Accept-Language': 'pt-BR,pt;q=0.9,en-US;q=0.8,en;q=0.7',
-            'Accept-Encoding': 'gzip, deflate, br',
             'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1',
             'Sec-Fetch-Dest': 'document',
@@ -23,7 +24,11 @@ class MagazineLuizaScraper:
             'Sec-Fetch-Site': 'none',
             'Cache-Control': 'max-age=0',
         }
-        self.session.headers.update(self.headers)
+        # Accept-Encoding is set by the client to the codecs it can actually decode
+        self.session = HttpClient(self.headers)
+        # Optional ProductVerifier; when set, titles without the specs are checked
+        # against their product page instead of being dropped
+        self.verifier = verifier
 
     def scrape_products(self):
         """Scrape products from Magazine Luiza"""
@@ -42,42 +47,11 @@ class MagazineLuizaScraper:
             try:
                 print(f"Tentando busca com: {search_url}")
                 
-                # Random delay to avoid being blocked
-                time.sleep(random.uniform(3, 6))
+                # Random delay to avoid being blocked (not needed when replaying)
+                if not transport.replaying:
+                    time.sleep(random.uniform(3, 6))
                 
-                response = self.session.get(search_url)
-                response.raise_for_status()  # Raise an exception for bad status codes
-                
-                soup = BeautifulSoup(response.text, 'html.parser')
-                
-                # Try different selectors based on our analysis of Magazine Luiza
-                selectors = [
-                    '[data-testid="product-card-container"]',
-                    '[data-testid="product-card-content"]',
-                    '[data-testid="product-card"]',
-                    '[data-testid="product-list"] [class*="product"]',
-                    'article[data-testid*="product"]',
-                    'div[data-testid*="product"]',
-                    'li[data-testid*="product"]',
-                    'div[data-testid="mod-productlist"]',
-                    'div[data-testid="product-list"]'
-                ]
-                
-                product_containers = []
-                for selector in selectors:
-                    elements = soup.select(selector)
-                    if elements:
-                        product_containers = elements
-                        break
-                
-                # If no containers found with selectors, try a more general approach
-                if not product_containers:
-                    product_containers = soup.find_all(['article', 'div', 'li'], attrs={'data-testid': lambda x: x and ('product' in x or 'card' in x)})
-                
-                for container in product_containers:
-                    product = self.extract_product_info(container)
-                    if product:
-                        products.append(product)
+                products = self.scrape_search_page(search_url)
                 
                 # If we found products, break out of the loop
                 if products:
@@ -92,6 +66,51 @@ class MagazineLuizaScraper:
         
         return products
 
+    def scrape_search_page(self, search_url):
+        """Fetch and parse one Magazine Luiza search results page"""
+        # Raises requests.RequestException for bad status codes
+        with profiler.phase('Magazine Luiza', 'fetch'):
+            content = self.session.get_content(search_url)
+        with profiler.phase('Magazine Luiza', 'parse'):
+            soup = BeautifulSoup(content, 'html.parser')
+        with profiler.phase('Magazine Luiza', 'extract'):
+            products = self.extract_products(soup)
+        return verify_offers(self.verifier, products, 'Magazine Luiza')
+
+    def extract_products(self, soup):
+        """Find product containers in a parsed search page and extract their products"""
+        # Try different selectors based on our analysis of Magazine Luiza
+        selectors = [
+            '[data-testid="product-card-container"]',
+            '[data-testid="product-card-content"]',
+            '[data-testid="product-card"]',
+            '[data-testid="product-list"] [class*="product"]',
+            'article[data-testid*="product"]',
+            'div[data-testid*="product"]',
+            'li[data-testid*="product"]',
+            'div[data-testid="mod-productlist"]',
+            'div[data-testid="product-list"]'
+        ]
+        
+        product_containers = []
+        for selector in selectors:
+            elements = soup.select(selector)
+            if elements:
+                product_containers = elements
+                break
+        
+        # If no containers found with selectors, try a more general approach
+        if not product_containers:
+            product_containers = soup.find_all(['article', 'div', 'li'], attrs={'data-testid': lambda x: x and ('product' in x or 'card' in x)})
+        
+        products = []
+        for container in product_containers:
+            product = self.extract_product_info(container)
+            if product:
+                products.append(product)
+        
+        return products
+
     def extract_product_info(self, container):
         """Extract product info from Magazine Luiza"""
         try:
@@ -186,13 +205,10 @@ class MagazineLuizaScraper:
                 'recond' not in title.lower() and
                 'usado' not in title.lower() and
                 'segunda mão' not in title.lower()):
-                return {
-                    'title': title,
-                    'price': price,
-                    'link': link,
-                    'store': 'Magazine Luiza',
-                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
+                return Offer(title, parse_price_cents(price), link, 'Magazine Luiza')
+            # Titles without the specs are kept only when they can be verified on the product page
+            elif self.verifier and is_target_model(title) and title_is_ambiguous(title):
+                return Offer(title, parse_price_cents(price), link, 'Magazine Luiza')
         
         except Exception as e:
             print(f"Error extracting Magazine Luiza product info: {e}")
@@ -205,13 +221,7 @@ class MagazineLuizaScraper:
         # Limit to top 5 products
         top_5_products = products[:5] if len(products) > 5 else products
         
-        with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['title', 'price', 'link', 'store', 'timestamp']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            
-            writer.writeheader()
-            for product in top_5_products:
-                writer.writerow(product)
+        write_csv(top_5_products, filename)
         
         print(f"Resultados salvos em {filename}")
 
@@ -228,16 +238,23 @@ class MagazineLuizaScraper:
         print("-" * 100)
         
         for i, product in enumerate(top_5_products, 1):
-            print(f"{i}. {product['title']}")
-            print(f"   Preço: {product['price']}")
-            print(f"   Loja: {product['store']}")
-            print(f"   Link: {product['link']}")
-            print(f"   Data/Hora: {product['timestamp']}")
+            print(f"{i}. {product.title}")
+            print(f"   Preço: {product.price}")
+            print(f"   Loja: {product.store}")
+            print(f"   Link: {product.link}")
+            print(f"   Data/Hora: {product.formatted_timestamp}")
             print("-" * 100)
 
 
 def main():
-    scraper = MagazineLuizaScraper()
+    # Pass --profile to write CPU/memory profiles of each phase to perfis/
+    if profile_requested():
+        profiler.enable()
+    # Pass --record FILE to archive every response, or --replay FILE to run offline from one
+    transport.configure_from_argv()
+    
+    # Pass --verify to check listings without specs in the title against their product page
+    scraper = MagazineLuizaScraper(verifier=ProductVerifier() if '--verify' in sys.argv else None)
     
     print("Iniciando monitoramento de preços do Samsung Galaxy A05s na Magazine Luiza...")
     print("Este processo pode levar alguns minutos.\n")
@@ -247,15 +264,19 @@ def main():
     scraper.print_results(products)
     
     if products:
-        scraper.save_results(products)
-        
-        # Also save to JSON for additional format
-        with open('precos_magazine_luiza_galaxy_a05s.json', 'w', encoding='utf-8') as jsonfile:
-            json.dump(products, jsonfile, ensure_ascii=False, indent=2)
+        with profiler.phase('Magazine Luiza', 'output'):
+            # Replayed results go next to the archive instead of over the live files
+            scraper.save_results(products, transport.output_path('precos_magazine_luiza_galaxy_a05s.csv'))
+            
+            # Also save to JSON for additional format
+            json_file = transport.output_path('precos_magazine_luiza_galaxy_a05s.json')
+            write_json(products, json_file)
         
-        print("\nDados também salvos em precos_magazine_luiza_galaxy_a05s.json")
+        print(f"\nDados também salvos em {json_file}")
     else:
         print("\nNenhum produto correspondente encontrado na Magazine Luiza.")
+    
+    profiler.write_reports()
 
 
 if __name__ == "__main__":
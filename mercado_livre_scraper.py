@@ -1,39 +1,47 @@
+import sys
 import requests
 from bs4 import BeautifulSoup
 import time
-import csv
-import json
-from datetime import datetime
 import random
 import re
+from http_client import HttpClient
+from offer import Offer, parse_price_cents, write_csv, write_json
+from product_verification import ProductVerifier, is_target_model, title_is_ambiguous, verify_offers
+from profiling import profile_requested, profiler
+from replay import transport
 
 class MercadoLivreScraper:
-    def __init__(self):
-        self.session = requests.Session()
+    def __init__(self, verifier=None):
         # Headers to mimic a real browser
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
             'Accept-Language': 'pt-BR,pt;q=0.9,en-US;q=0.8,en;q=0.7',
-            'Accept-Encoding': 'gzip, deflate',
             'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1',
         }
-        self.session.headers.update(self.headers)
+        # Accept-Encoding is set by the client to the codecs it can actually decode
+        self.session = HttpClient(self.headers)
+        # Optional ProductVerifier; when set, titles without the specs are checked
+        # against their product page instead of being dropped
+        self.verifier = verifier
 
-    def search_products(self, query):
+    def search_products(self, query, page=1):
         """Search for products on Mercado Livre"""
         # Format the search URL
         search_url = f"https://lista.mercadolivre.com.br/{query.replace(' ', '-')}"
+        # Mercado Livre paginates with the offset of the first item (50 items per page)
+        if page > 1:
+            search_url += f"_Desde_{(page - 1) * 50 + 1}"
         
         try:
-            # Random delay to avoid being blocked
-            time.sleep(random.uniform(1, 3))
+            # Random delay to avoid being blocked (not needed when replaying)
+            if not transport.replaying:
+                time.sleep(random.uniform(1, 3))
             
-            response = self.session.get(search_url)
-            response.raise_for_status()  # Raise an exception for bad status codes
-            
-            return response.text
+            # Raises requests.RequestException for bad status codes
+            with profiler.phase('Mercado Livre', 'fetch'):
+                return self.session.get_content(search_url)
         except requests.RequestException as e:
             print(f"Error accessing Mercado Livre: {e}")
             return None
@@ -43,8 +51,14 @@ class MercadoLivreScraper:
         if not html_content:
             return []
         
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
+        with profiler.phase('Mercado Livre', 'parse'):
+            soup = BeautifulSoup(html_content, 'html.parser')
+        with profiler.phase('Mercado Livre', 'extract'):
+            products = self.extract_products(soup)
+        return verify_offers(self.verifier, products, 'Mercado Livre')
+
+    def extract_products(self, soup):
+        """Find product containers in a parsed search page and extract their products"""
         # Find product containers - Mercado Livre typically uses specific classes for product listings
         product_containers = soup.find_all('li', class_=re.compile(r'ui-search-layout__item|search-item|results-item'))
         
@@ -120,12 +134,10 @@ class MercadoLivreScraper:
                 'usado' not in title.lower() and
                 'segunda mão' not in title.lower() and
                 'desbloqueado' not in title.lower()):
-                return {
-                    'title': title,
-                    'price': price,
-                    'link': link,
-                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
+                return Offer(title, parse_price_cents(price), link, 'Mercado Livre')
+            # Titles without the specs are kept only when they can be verified on the product page
+            elif self.verifier and is_target_model(title, excluded=('desbloqueado',)) and title_is_ambiguous(title):
+                return Offer(title, parse_price_cents(price), link, 'Mercado Livre')
         
         except Exception as e:
             print(f"Error extracting product info: {e}")
@@ -168,12 +180,10 @@ class MercadoLivreScraper:
                 'usado' not in title.lower() and
                 'segunda mão' not in title.lower() and
                 'desbloqueado' not in title.lower()):
-                return {
-                    'title': title,
-                    'price': price,
-                    'link': link,
-                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
+                return Offer(title, parse_price_cents(price), link, 'Mercado Livre')
+            # Titles without the specs are kept only when they can be verified on the product page
+            elif self.verifier and is_target_model(title, excluded=('desbloqueado',)) and title_is_ambiguous(title):
+                return Offer(title, parse_price_cents(price), link, 'Mercado Livre')
         
         except Exception as e:
             print(f"Error in alternative extraction: {e}")
@@ -210,8 +220,8 @@ class MercadoLivreScraper:
         seen_links = set()
         unique_products = []
         for product in all_products:
-            if product['link'] not in seen_links:
-                seen_links.add(product['link'])
+            if product.link not in seen_links:
+                seen_links.add(product.link)
                 unique_products.append(product)
         
         return unique_products
@@ -221,13 +231,7 @@ class MercadoLivreScraper:
         # Limit to top 5 products
         top_5_products = products[:5] if len(products) > 5 else products
         
-        with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['title', 'price', 'link', 'timestamp']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            
-            writer.writeheader()
-            for product in top_5_products:
-                writer.writerow(product)
+        write_csv(top_5_products, filename)
         
         print(f"Resultados salvos em {filename}")
 
@@ -244,15 +248,22 @@ class MercadoLivreScraper:
         print("-" * 80)
         
         for i, product in enumerate(top_5_products, 1):
-            print(f"{i}. {product['title']}")
-            print(f"   Preço: {product['price']}")
-            print(f"   Link: {product['link']}")
-            print(f"   Data/Hora: {product['timestamp']}")
+            print(f"{i}. {product.title}")
+            print(f"   Preço: {product.price}")
+            print(f"   Link: {product.link}")
+            print(f"   Data/Hora: {product.formatted_timestamp}")
             print("-" * 80)
 
 
 def main():
-    scraper = MercadoLivreScraper()
+    # Pass --profile to write CPU/memory profiles of each phase to perfis/
+    if profile_requested():
+        profiler.enable()
+    # Pass --record FILE to archive every response, or --replay FILE to run offline from one
+    transport.configure_from_argv()
+    
+    # Pass --verify to check listings without specs in the title against their product page
+    scraper = MercadoLivreScraper(verifier=ProductVerifier() if '--verify' in sys.argv else None)
     
     print("Iniciando monitoramento de preços do Samsung Galaxy A05s...")
     print("Este processo pode levar alguns minutos.\n")
@@ -262,15 +273,19 @@ def main():
     scraper.print_results(products)
     
     if products:
-        scraper.save_results(products)
-        
-        # Also save to JSON for additional format
-        with open('precos_galaxy_a05s.json', 'w', encoding='utf-8') as jsonfile:
-            json.dump(products, jsonfile, ensure_ascii=False, indent=2)
+        with profiler.phase('Mercado Livre', 'output'):
+            # Replayed results go next to the archive instead of over the live files
+            scraper.save_results(products, transport.output_path('precos_galaxy_a05s.csv'))
+            
+            # Also save to JSON for additional format
+            json_file = transport.output_path('precos_galaxy_a05s.json')
+            write_json(products, json_file)
         
-        print("\nDados também salvos em precos_galaxy_a05s.json")
+        print(f"\nDados também salvos em {json_file}")
     else:
         print("\nNenhum produto correspondente encontrado.")
+    
+    profiler.write_reports()
 
 
 if __name__ == "__main__":
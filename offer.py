@@ -0,0 +1,156 @@
+import csv
+import json
+import re
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from functools import lru_cache
+
+FIELDNAMES = ['title', 'price', 'link', 'store', 'timestamp']
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+PRICE_NOT_FOUND = "Preço não encontrado"
+
+
+def parse_price_cents(price):
+    """Convert a price like 'R$ 1.099,90' to integer cents (None if there is no number)"""
+    digits = re.sub(r'[^\d,.]', '', price or '')
+    if not digits:
+        return None
+    # Brazilian format: '.' separates thousands and ',' separates cents
+    if ',' in digits:
+        reais, _, cents = digits.rpartition(',')
+        reais = reais.replace('.', '')
+    else:
+        reais, cents = digits.replace('.', ''), '0'
+    try:
+        return int(reais or 0) * 100 + int(cents[:2].ljust(2, '0'))
+    except ValueError:
+        return None
+
+
+def format_price(price_cents):
+    """Format integer cents as 'R$ 1.099,90'"""
+    if price_cents is None:
+        return PRICE_NOT_FOUND
+    reais, cents = divmod(price_cents, 100)
+    return f"R$ {reais:,}".replace(',', '.') + f",{cents:02d}"
+
+
+@lru_cache(maxsize=1024)
+def format_timestamp(timestamp):
+    """Format an epoch timestamp; offers of a sweep share a few seconds, so this is cached"""
+    return datetime.fromtimestamp(timestamp).strftime(TIMESTAMP_FORMAT)
+
+
+def parse_timestamp(text):
+    """Convert a formatted timestamp back to epoch seconds"""
+    return int(datetime.strptime(text, TIMESTAMP_FORMAT).timestamp())
+
+
+@lru_cache(maxsize=4096)
+def product_key(title):
+    """Normalize a product title to an interned key such as 'galaxy-a05s-128gb-6gb'"""
+    title_lower = title.lower()
+    model = re.search(r'galaxy\s*(a\d+\w*)', title_lower)
+    parts = ['galaxy-' + model.group(1)] if model else [re.sub(r'\W+', '-', title_lower).strip('-')[:40]]
+    sizes = [int(size) for size in re.findall(r'(\d+)\s*gb', title_lower)]
+    ram = re.search(r'(\d+)\s*gb\s*(de\s*)?ram', title_lower)
+    if sizes:
+        # Storage is the largest size; RAM is the one marked as such, or else the smallest
+        parts.append(f'{max(sizes)}gb')
+        if ram:
+            parts.append(ram.group(1) + 'gb')
+        elif len(sizes) > 1:
+            parts.append(f'{min(sizes)}gb')
+    return sys.intern('-'.join(parts))
+
+
+class Offer:
+    """A product offer found by a scraper"""
+
+    __slots__ = ('title', 'price_cents', 'link', 'store', 'product', 'timestamp')
+
+    def __init__(self, title, price_cents, link, store, timestamp=None, product=None):
+        self.title = title
+        self.price_cents = price_cents
+        self.link = link
+        # Store names and product keys repeat on every offer, so they share one string object
+        self.store = sys.intern(store) if store else store
+        self.product = sys.intern(product) if product else product_key(title)
+        self.timestamp = int(timestamp if timestamp is not None else time.time())
+
+    @property
+    def price(self):
+        return format_price(self.price_cents)
+
+    @property
+    def formatted_timestamp(self):
+        return format_timestamp(self.timestamp)
+
+    @classmethod
+    def from_dict(cls, data, store=None):
+        """Build an offer from a dict written by to_dict (or by older versions of the scrapers)"""
+        timestamp = data.get('timestamp')
+        if isinstance(timestamp, str):
+            timestamp = parse_timestamp(timestamp)
+        return cls(data['title'], parse_price_cents(data.get('price')), data.get('link'),
+                   data.get('store') or store, timestamp)
+
+    def to_dict(self):
+        return {
+            'title': self.title,
+            'price': self.price,
+            'link': self.link,
+            'store': self.store,
+            'timestamp': self.formatted_timestamp,
+        }
+
+    def to_csv_row(self):
+        return (self.title, self.price, self.link, self.store, self.formatted_timestamp)
+
+    def to_sqlite_row(self):
+        return (self.timestamp, self.store, self.product, self.title, self.price_cents, self.link)
+
+    def __repr__(self):
+        return f"Offer({self.title!r}, {self.price!r}, {self.store!r})"
+
+
+def write_csv(offers, filename):
+    with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(FIELDNAMES)
+        writer.writerows(offer.to_csv_row() for offer in offers)
+
+
+def write_json(offers, filename):
+    with open(filename, 'w', encoding='utf-8') as jsonfile:
+        json.dump([offer.to_dict() for offer in offers], jsonfile, ensure_ascii=False, indent=2)
+
+
+def write_jsonl(offers, filename):
+    with open(filename, 'a', encoding='utf-8') as jsonlfile:
+        jsonlfile.writelines(json.dumps(offer.to_dict(), ensure_ascii=False) + '\n' for offer in offers)
+
+
+def write_sqlite(offers, filename, table='offers'):
+    conn = sqlite3.connect(filename)
+    with conn:
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                ts INTEGER NOT NULL,
+                store TEXT NOT NULL,
+                product TEXT NOT NULL,
+                title TEXT,
+                price_cents INTEGER,
+                link TEXT
+            )
+        ''')
+        conn.executemany(f'INSERT INTO {table} VALUES (?, ?, ?, ?, ?, ?)', (offer.to_sqlite_row() for offer in offers))
+    conn.close()
+
+
+def read_json(filename, store=None):
+    """Read offers from a JSON file written by the scrapers"""
+    with open(filename, 'r', encoding='utf-8') as jsonfile:
+        return [Offer.from_dict(data, store) for data in json.load(jsonfile)]
@@ -0,0 +1,172 @@
+import argparse
+import math
+import sqlite3
+import time
+
+import numpy as np
+
+from price_analytics import DAY, PriceHistory
+
+# Pseudo-observation time (days) pulling sparse listings towards their store's pooled rate
+PRIOR_DAYS = 7.0
+# Rate assumed for a store without any history yet (price changes per day)
+DEFAULT_RATE = 1.0
+
+
+def estimate_listing_rates(history, since_days=60, now=None):
+    """Estimate the price change rate (changes per day) of each (store, link) listing"""
+    now = now or time.time()
+    rows = history.conn.execute('''
+        SELECT store, link, ts, price_cents FROM observations
+        WHERE outlier = 0 AND link IS NOT NULL AND ts >= ?
+        ORDER BY store, link, ts
+    ''', (int(now - since_days * DAY),)).fetchall()
+    if not rows:
+        return {}
+
+    stores = np.array([r[0] for r in rows], dtype=object)
+    links = np.array([r[1] for r in rows], dtype=object)
+    ts = np.array([r[2] for r in rows], dtype=np.float64)
+    prices = np.array([r[3] for r in rows], dtype=np.int64)
+
+    # Consecutive rows of the same listing; a change is a different price between them
+    same = (stores[1:] == stores[:-1]) & (links[1:] == links[:-1])
+    changed = same & (prices[1:] != prices[:-1])
+    starts = np.flatnonzero(np.concatenate([[True], ~same]))
+    group = np.cumsum(np.concatenate([[True], ~same])) - 1
+    changes = np.bincount(group[1:], weights=changed, minlength=len(starts))
+    ends = np.concatenate([starts[1:], [len(rows)]]) - 1
+    # A listing seen once has still been watched for some time; count at least a day
+    spans = np.maximum((ts[ends] - ts[starts]) / DAY, 1.0)
+
+    # Pooled rate per store, used as the prior for listings with little history; it is itself
+    # pulled towards DEFAULT_RATE so a few quiet days don't make a store look frozen
+    group_stores = stores[starts]
+    pooled = {}
+    for store in set(group_stores):
+        mask = group_stores == store
+        pooled[store] = (changes[mask].sum() + PRIOR_DAYS * DEFAULT_RATE) / (spans[mask].sum() + PRIOR_DAYS)
+    prior = np.array([pooled[store] for store in group_stores])
+    rates = (changes + PRIOR_DAYS * prior) / (spans + PRIOR_DAYS)
+
+    return {(group_stores[i], links[starts[i]]): float(rates[i]) for i in range(len(starts))}
+
+
+def estimate_store_rates(listing_rates):
+    """Rate at which any listing of a store changes price (sum of its listing rates)"""
+    rates = {}
+    for (store, _), rate in listing_rates.items():
+        rates[store] = rates.get(store, 0.0) + rate
+    return rates
+
+
+def expected_catches(rate, polls):
+    """Expected changes noticed per day when a Poisson(rate) target is polled polls times a day"""
+    if polls <= 0:
+        return 0.0
+    return polls * (1 - math.exp(-rate / polls))
+
+
+def polls_for_multiplier(rate, cost, multiplier, min_polls, max_polls):
+    """Poll frequency where the marginal catch per request equals the multiplier"""
+    # d/df [f (1 - e^(-r/f))] = 1 - e^(-x) (1 + x) with x = r/f, decreasing in f
+    target = multiplier * cost
+    if rate <= 0 or target >= 1:
+        return min_polls
+    low, high = min_polls, max_polls
+    for _ in range(60):
+        mid = (low + high) / 2
+        x = rate / mid
+        if 1 - math.exp(-x) * (1 + x) > target:
+            low = mid
+        else:
+            high = mid
+    return low
+
+
+def allocate_budget(rates, costs, budget, min_polls, max_polls):
+    """Split a daily request budget among targets to maximize the price changes caught
+
+    rates are changes per day, costs are requests per poll; returns polls per day for
+    each target, kept between min_polls and max_polls.
+    """
+    floor = sum(costs[t] * min_polls for t in rates)
+    if budget <= floor:
+        return {t: min_polls for t in rates}
+    if budget >= sum(costs[t] * max_polls for t in rates):
+        return {t: max_polls for t in rates}
+
+    # Bisect on the Lagrange multiplier until the allocation spends the budget
+    low, high = 0.0, 1.0 / min(costs.values())
+    for _ in range(60):
+        multiplier = (low + high) / 2
+        spent = sum(costs[t] * polls_for_multiplier(rates[t], costs[t], multiplier, min_polls, max_polls)
+                    for t in rates)
+        if spent > budget:
+            low = multiplier
+        else:
+            high = multiplier
+    allocation = {t: polls_for_multiplier(rates[t], costs[t], high, min_polls, max_polls) for t in rates}
+
+    # Targets with no expected gain stay at min_polls and can leave budget unspent; share
+    # it evenly (up to max_polls) so the estimator still gets fresh data
+    spare = budget - sum(costs[t] * allocation[t] for t in rates)
+    growing = [t for t in rates if allocation[t] < max_polls]
+    while spare > 1e-9 and growing:
+        step = spare / sum(costs[t] for t in growing)
+        for t in growing:
+            allocation[t] = min(allocation[t] + step, max_polls)
+        spare = budget - sum(costs[t] * allocation[t] for t in rates)
+        growing = [t for t in growing if allocation[t] < max_polls]
+    return allocation
+
+
+class PollSchedule:
+    """Last poll time of each target, to decide which ones are due"""
+
+    def __init__(self, filename='agenda_coleta.db'):
+        self.conn = sqlite3.connect(filename)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS polls (target TEXT PRIMARY KEY, last_polled REAL NOT NULL)')
+
+    def due(self, allocation, now=None):
+        """Targets whose interval (1 / polls per day) has elapsed since their last poll"""
+        now = now or time.time()
+        last = dict(self.conn.execute('SELECT target, last_polled FROM polls').fetchall())
+        return [target for target, polls in allocation.items()
+                if target not in last or now - last[target] >= DAY / polls]
+
+    def mark_polled(self, targets, now=None):
+        now = now or time.time()
+        self.conn.executemany('INSERT OR REPLACE INTO polls VALUES (?, ?)', [(t, now) for t in targets])
+        self.conn.commit()
+
+
+def plan(store_queries, budget, pages=1, min_interval_hours=0.5, max_interval_hours=72,
+         history_file='historico_precos.db'):
+    """Polls per day for each store, from its estimated change rate and a daily request budget"""
+    store_rates = estimate_store_rates(estimate_listing_rates(PriceHistory(history_file)))
+    rates = {store: store_rates.get(store, DEFAULT_RATE) for store in store_queries}
+    # Polling a store runs every query and page once
+    costs = {store: len(queries) * pages for store, queries in store_queries.items()}
+    allocation = allocate_budget(rates, costs, budget, 24 / max_interval_hours, 24 / min_interval_hours)
+    return rates, costs, allocation
+
+
+def main():
+    from work_queue import STORE_QUERIES
+
+    parser = argparse.ArgumentParser(description='Distribui um orçamento diário de requisições entre as lojas')
+    parser.add_argument('--budget', type=float, default=200, help='requisições por dia')
+    parser.add_argument('--pages', type=int, default=1)
+    parser.add_argument('--history-file', default='historico_precos.db')
+    args = parser.parse_args()
+
+    rates, costs, allocation = plan(STORE_QUERIES, args.budget, args.pages, history_file=args.history_file)
+    for store, polls in allocation.items():
+        print(f"{store}: {rates[store]:.2f} mudanças/dia, {polls:.2f} coletas/dia "
+              f"(a cada {24 / polls:.1f} h, {costs[store] * polls:.0f} requisições/dia), "
+              f"~{expected_catches(rates[store], polls):.2f} mudanças detectadas/dia")
+
+
+if __name__ == "__main__":
+    main()
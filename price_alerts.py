@@ -0,0 +1,309 @@
+import argparse
+import bisect
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime
+
+import requests
+
+from offer import read_json
+
+# Files written by each scraper and the store they come from
+STORE_FILES = {
+    'precos_galaxy_a05s.json': 'Mercado Livre',
+    'precos_magazine_luiza_galaxy_a05s.json': 'Magazine Luiza',
+    'precos_kabum_galaxy_a05s.json': 'Kabum',
+}
+
+ANY_STORE = '*'
+
+
+# Rule kinds that compare the observed price against a threshold in 'value'
+THRESHOLD_KINDS = ('price_below', 'drop_percent')
+
+
+class Rule:
+    """An alert rule; kind is 'price_below', 'drop_percent' or 'cheapest_changed'"""
+
+    def __init__(self, rule_id, kind, product, store=ANY_STORE, value=None, window=86400, cooldown=3600):
+        self.rule_id = rule_id
+        self.kind = kind
+        self.product = product
+        self.store = store
+        # Threshold in cents for price_below, percentage for drop_percent
+        self.value = value
+        self.window = window
+        self.cooldown = cooldown
+        self.last_fired = None
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        if data['kind'] in THRESHOLD_KINDS and data.get('value') is None:
+            raise ValueError(f"Alert rule {data.get('rule_id')} ({data['kind']}) needs a 'value'")
+        # price_below thresholds are written in reais (900 or 899.90) and kept in cents
+        if data['kind'] == 'price_below':
+            data['value'] = round(data['value'] * 100)
+        return cls(**data)
+
+    def describe(self, store, price_cents, detail):
+        """Human readable alert message"""
+        price = price_cents / 100
+        if self.kind == 'price_below':
+            return f"{self.product} por R$ {price:.2f} na {store} (abaixo de R$ {self.value / 100:.2f})"
+        if self.kind == 'drop_percent':
+            return f"{self.product} caiu {detail:.1f}% na {store}, agora R$ {price:.2f}"
+        return f"{self.product} mais barato agora na {store} (R$ {price:.2f}), antes na {detail}"
+
+
+class RuleIndex:
+    """Rules of one kind grouped by (product, store) and sorted by threshold"""
+
+    def __init__(self):
+        self.values = {}
+        self.rules = {}
+
+    def add(self, rule):
+        key = (rule.product, rule.store)
+        values = self.values.setdefault(key, [])
+        rules = self.rules.setdefault(key, [])
+        pos = bisect.bisect_right(values, rule.value)
+        values.insert(pos, rule.value)
+        rules.insert(pos, rule)
+
+    def above(self, product, store, value):
+        """Rules whose threshold is strictly greater than value"""
+        for key in ((product, store), (product, ANY_STORE)):
+            if key in self.values:
+                yield from self.rules[key][bisect.bisect_right(self.values[key], value):]
+
+    def below(self, product, store, value):
+        """Rules whose threshold is strictly lower than value"""
+        for key in ((product, store), (product, ANY_STORE)):
+            if key in self.values:
+                yield from self.rules[key][:bisect.bisect_left(self.values[key], value)]
+
+
+class WebhookSink:
+    """Posts alerts as JSON to a webhook URL"""
+
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def send(self, alert):
+        try:
+            response = self.session.post(self.url, json=alert, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            print(f"Error sending alert to webhook: {e}")
+
+
+class AlertEngine:
+    """Evaluates alert rules incrementally, one sweep (or store price) at a time"""
+
+    def __init__(self, rules, sink, state_file='estado_alertas.json', stale_after=3 * 86400):
+        self.sink = sink
+        self.state_file = state_file
+        # A store's price is forgotten when it has not been seen for this long (seconds)
+        self.stale_after = stale_after
+        self.rules = {rule.rule_id: rule for rule in rules}
+        self.price_below = RuleIndex()
+        # cheapest_changed rules have no threshold, so they are only grouped by (product, store)
+        self.cheapest_changed = {}
+        # Drop rules are indexed per window so the reference price is computed once per window
+        self.drop_percent = {}
+        for rule in rules:
+            if rule.kind == 'price_below':
+                self.price_below.add(rule)
+            elif rule.kind == 'drop_percent':
+                self.drop_percent.setdefault(rule.window, RuleIndex()).add(rule)
+            elif rule.kind == 'cheapest_changed':
+                self.cheapest_changed.setdefault((rule.product, rule.store), []).append(rule)
+            else:
+                raise ValueError(f"Unknown alert rule kind: {rule.kind}")
+        # Recent (timestamp, price) per (product, store), with the longest drop window kept
+        self.max_window = max(self.drop_percent, default=0)
+        self.history = {}
+        # Latest [price, timestamp] per store and current cheapest store per product
+        self.latest = {}
+        self.cheapest = {}
+        self.load_state()
+
+    def load_state(self):
+        """Restore price history, cheapest stores and cooldowns from a previous run"""
+        if not self.state_file or not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not read alert state {self.state_file}: {e}")
+            return
+        for key, points in state.get('history', {}).items():
+            product, store = key.split('|', 1)
+            self.history[(product, store)] = deque(tuple(p) for p in points)
+        # Older state files kept only the price; such entries expire on the next check
+        self.latest = {product: {store: entry if isinstance(entry, list) else [entry, 0] for store, entry in prices.items()}
+                       for product, prices in state.get('latest', {}).items()}
+        self.cheapest = state.get('cheapest', {})
+        for rule_id, fired in state.get('last_fired', {}).items():
+            if rule_id in self.rules:
+                self.rules[rule_id].last_fired = fired
+
+    def save_state(self):
+        """Persist price history, cheapest stores and cooldowns"""
+        state = {
+            'history': {f'{product}|{store}': list(points) for (product, store), points in self.history.items()},
+            'latest': self.latest,
+            'cheapest': self.cheapest,
+            'last_fired': {rule.rule_id: rule.last_fired for rule in self.rules.values() if rule.last_fired},
+        }
+        with open(self.state_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+
+    def observe(self, product, store, price_cents, timestamp=None, link=None):
+        """Check one store's price for a product and return the alerts sent"""
+        timestamp = timestamp or time.time()
+        if not self.is_new(product, store, timestamp):
+            return []
+        triggered = self.check_price(product, store, price_cents, timestamp, link)
+        triggered.extend(self.check_cheapest(product, timestamp))
+        return self.send(triggered, timestamp)
+
+    def observe_sweep(self, offers):
+        """Check the offers of one sweep, reduced to the lowest price of each store and product"""
+        lowest = {}
+        for offer in offers:
+            # A store that failed keeps last run's result file; its offers were already checked
+            if offer.price_cents is None or not self.is_new(offer.product, offer.store, offer.timestamp):
+                continue
+            key = (offer.product, offer.store)
+            if key not in lowest or offer.price_cents < lowest[key].price_cents:
+                lowest[key] = offer
+        if not lowest:
+            return []
+
+        # The cheapest store is decided once all stores of the sweep have been seen
+        timestamp = max(offer.timestamp for offer in lowest.values())
+        triggered = []
+        for offer in lowest.values():
+            triggered.extend(self.check_price(offer.product, offer.store, offer.price_cents, offer.timestamp, offer.link))
+        for product in {product for product, _ in lowest}:
+            triggered.extend(self.check_cheapest(product, timestamp))
+        return self.send(triggered, timestamp)
+
+    def observe_offer(self, offer):
+        """Check an offer found by the scrapers"""
+        return self.observe_sweep([offer])
+
+    def is_new(self, product, store, timestamp):
+        """True if the observation is newer than the last one seen for this product and store"""
+        seen = self.latest.get(product, {}).get(store)
+        return seen is None or timestamp > seen[1]
+
+    def check_price(self, product, store, price_cents, timestamp, link):
+        """Record a store's price and return the price_below and drop_percent rules it triggers"""
+        # Each entry is (rule, product, store, price_cents, detail, link)
+        triggered = []
+
+        # price_below: only rules with a threshold above the observed price
+        for rule in self.price_below.above(product, store, price_cents):
+            triggered.append((rule, product, store, price_cents, None, link))
+
+        # drop_percent: only rules with a percentage below the drop from the window's highest price
+        points = self.history.setdefault((product, store), deque())
+        while points and points[0][0] < timestamp - self.max_window:
+            points.popleft()
+        for window, index in self.drop_percent.items():
+            reference = max((p for t, p in points if t >= timestamp - window), default=None)
+            if reference and reference > price_cents:
+                drop = (reference - price_cents) * 100 / reference
+                for rule in index.below(product, store, drop):
+                    triggered.append((rule, product, store, price_cents, drop, link))
+        if self.max_window:
+            points.append((timestamp, price_cents))
+
+        self.latest.setdefault(product, {})[store] = [price_cents, timestamp]
+        return triggered
+
+    def check_cheapest(self, product, timestamp):
+        """Return the cheapest_changed rules triggered when the cheapest store of a product changes"""
+        # Stores that stopped listing the product no longer compete for the lowest price
+        prices = self.latest.get(product, {})
+        for store in [store for store, (_, seen) in prices.items() if seen < timestamp - self.stale_after]:
+            del prices[store]
+        if not prices:
+            return []
+
+        cheapest_store = min(prices, key=lambda store: prices[store][0])
+        previous = self.cheapest.get(product)
+        self.cheapest[product] = cheapest_store
+        if not previous or cheapest_store == previous:
+            return []
+        triggered = []
+        for key in ((product, cheapest_store), (product, ANY_STORE)):
+            for rule in self.cheapest_changed.get(key, []):
+                triggered.append((rule, product, cheapest_store, prices[cheapest_store][0], previous, None))
+        return triggered
+
+    def send(self, triggered, timestamp):
+        """Send the triggered rules that are not in their cooldown period"""
+        alerts = []
+        for rule, product, store, price_cents, detail, link in triggered:
+            # Debounce: a rule fires at most once per cooldown period
+            if rule.last_fired is not None and timestamp - rule.last_fired < rule.cooldown:
+                continue
+            rule.last_fired = timestamp
+            alert = {
+                'rule_id': rule.rule_id,
+                'kind': rule.kind,
+                'message': rule.describe(store, price_cents, detail),
+                'product': product,
+                'store': store,
+                'price': price_cents / 100,
+                'link': link,
+                'timestamp': datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S'),
+            }
+            self.sink.send(alert)
+            alerts.append(alert)
+        return alerts
+
+
+def load_rules(filename):
+    """Load alert rules from a JSON list"""
+    with open(filename, 'r', encoding='utf-8') as f:
+        return [Rule.from_dict(data) for data in json.load(f)]
+
+
+def check_result_files(rules_file, webhook_url, files=None):
+    """Evaluate the alert rules against the JSON files written by the scrapers"""
+    engine = AlertEngine(load_rules(rules_file), WebhookSink(webhook_url))
+    offers = []
+    for filename in files or STORE_FILES:
+        if not os.path.exists(filename):
+            continue
+        offers.extend(read_json(filename, STORE_FILES.get(os.path.basename(filename))))
+    alerts = engine.observe_sweep(offers)
+    engine.save_state()
+    return alerts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verifica regras de alerta de preço nos resultados dos scrapers')
+    parser.add_argument('--rules', default='regras_alerta.json')
+    parser.add_argument('--webhook', required=True)
+    parser.add_argument('files', nargs='*')
+    args = parser.parse_args()
+
+    alerts = check_result_files(args.rules, args.webhook, args.files)
+    for alert in alerts:
+        print(alert['message'])
+    print(f"{len(alerts)} alertas enviados")
+
+
+if __name__ == "__main__":
+    main()
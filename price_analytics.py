@@ -0,0 +1,232 @@
+import argparse
+import json
+import os
+import sqlite3
+import time
+import warnings
+
+import numpy as np
+
+from offer import read_json
+from price_alerts import STORE_FILES
+
+DAY = 86400
+HOUR = 3600
+
+# Observations further than this from the recent typical price are treated as bogus listings
+OUTLIER_LOW_RATIO = 0.3
+OUTLIER_HIGH_RATIO = 3.0
+# Smallest deviation (fraction of the median) used by the MAD test; with the default threshold
+# of 5 only prices about 50% away from a store's usual price are flagged, so real deals pass
+MAD_FLOOR = 0.10
+
+
+class PriceHistory:
+    """Price observations in SQLite, with daily and hourly rollups kept up to date on insert"""
+
+    def __init__(self, filename='historico_precos.db'):
+        # Several queue workers may write to the same file
+        self.conn = sqlite3.connect(filename, timeout=30)
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS observations (
+                ts INTEGER NOT NULL,
+                store TEXT NOT NULL,
+                product TEXT NOT NULL,
+                price_cents INTEGER NOT NULL,
+                link TEXT,
+                outlier INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS observations_key ON observations (product, store, ts);
+            CREATE TABLE IF NOT EXISTS rollup_daily (
+                bucket INTEGER NOT NULL,
+                store TEXT NOT NULL,
+                product TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                sum_cents INTEGER NOT NULL,
+                min_cents INTEGER NOT NULL,
+                max_cents INTEGER NOT NULL,
+                PRIMARY KEY (product, store, bucket)
+            );
+            CREATE TABLE IF NOT EXISTS rollup_hourly (
+                bucket INTEGER NOT NULL,
+                store TEXT NOT NULL,
+                product TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                sum_cents INTEGER NOT NULL,
+                min_cents INTEGER NOT NULL,
+                max_cents INTEGER NOT NULL,
+                PRIMARY KEY (product, store, bucket)
+            );
+        ''')
+        # A result file read twice (e.g. when a store failed and kept last run's file) must not
+        # be counted twice; drop duplicates left by older versions before adding the constraint
+        if not self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'observations_unique'").fetchone():
+            self.conn.execute('''
+                DELETE FROM observations WHERE rowid NOT IN (
+                    SELECT MIN(rowid) FROM observations GROUP BY ts, store, link
+                )
+            ''')
+            self.conn.execute('CREATE UNIQUE INDEX observations_unique ON observations (ts, store, link)')
+            self.conn.commit()
+
+    def recent_averages(self, product, store, ts, days=30):
+        """Daily average prices of a store over the last days, used to spot outliers"""
+        rows = self.conn.execute('''
+            SELECT sum_cents * 1.0 / count FROM rollup_daily
+            WHERE product = ? AND store = ? AND bucket >= ?
+        ''', (product, store, ts // DAY - days)).fetchall()
+        return np.fromiter((r[0] for r in rows), dtype=np.float64, count=len(rows))
+
+    def add(self, observations):
+        """Store (ts, store, product, price_cents, link) observations and update the rollups"""
+        observations = list(observations)
+        # Compare each price with the rest of the sweep for the same product (catches fake
+        # 'R$ 1' listings even before there is any history). Only gross ratios are checked
+        # here: a sweep mixes stores and listings, so a real deal sits far from its median ...
+        batch_outlier = np.zeros(len(observations), dtype=bool)
+        products = np.array([o[2] for o in observations], dtype=object)
+        prices = np.array([o[3] for o in observations], dtype=np.float64)
+        for product in set(products):
+            mask = products == product
+            batch_outlier[mask] = ratio_outliers(prices[mask], np.median(prices[mask]))
+
+        added = 0
+        for (ts, store, product, price_cents, link), flagged in zip(observations, batch_outlier):
+            # ... while the MAD test runs against the store's own recent daily averages
+            history = self.recent_averages(product, store, ts)
+            outlier = bool(flagged or (history.size and detect_outliers(np.append(history, price_cents))[-1]))
+            cursor = self.conn.execute('INSERT OR IGNORE INTO observations VALUES (?, ?, ?, ?, ?, ?)',
+                                       (ts, store, product, price_cents, link, int(outlier)))
+            # Already recorded, so it is already in the rollups too
+            if cursor.rowcount == 0:
+                continue
+            # Outliers stay in the raw table but never reach the rollups
+            if outlier:
+                print(f"Ignoring outlier price R$ {price_cents / 100:.2f} for {product} in {store}")
+                continue
+            for table, size in (('rollup_daily', DAY), ('rollup_hourly', HOUR)):
+                self.conn.execute(f'''
+                    INSERT INTO {table} VALUES (?, ?, ?, 1, ?, ?, ?)
+                    ON CONFLICT (product, store, bucket) DO UPDATE SET
+                        count = count + 1,
+                        sum_cents = sum_cents + excluded.sum_cents,
+                        min_cents = MIN(min_cents, excluded.min_cents),
+                        max_cents = MAX(max_cents, excluded.max_cents)
+                ''', (ts // size, store, product, price_cents, price_cents, price_cents))
+            added += 1
+        self.conn.commit()
+        return added
+
+    def add_offers(self, offers):
+        """Store offers found by the scrapers"""
+        return self.add((offer.timestamp, offer.store, offer.product, offer.price_cents, offer.link)
+                        for offer in offers if offer.price_cents is not None)
+
+    def daily_series(self, product, store, days):
+        """Daily min and average prices of the last days as dense arrays (NaN on days without data)"""
+        today = int(time.time()) // DAY
+        first = today - days + 1
+        rows = self.conn.execute('''
+            SELECT bucket, min_cents, sum_cents * 1.0 / count FROM rollup_daily
+            WHERE product = ? AND store = ? AND bucket >= ?
+        ''', (product, store, first)).fetchall()
+        minimum = np.full(days, np.nan)
+        average = np.full(days, np.nan)
+        if rows:
+            data = np.array(rows, dtype=np.float64)
+            index = data[:, 0].astype(np.int64) - first
+            minimum[index] = data[:, 1]
+            average[index] = data[:, 2]
+        return minimum, average
+
+    def stores(self, product):
+        return [r[0] for r in self.conn.execute('SELECT DISTINCT store FROM rollup_daily WHERE product = ?', (product,))]
+
+
+def rolling(values, window, func):
+    """Apply a NaN-aware reduction over a trailing window of a 1-D array"""
+    padded = np.concatenate([np.full(window - 1, np.nan), values])
+    windows = np.lib.stride_tricks.sliding_window_view(padded, window)
+    # All-NaN windows give NaN with a RuntimeWarning, which is what we want for days without data
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return func(windows, axis=1)
+
+
+def moving_average(values, window):
+    """Trailing moving average ignoring missing (NaN) days"""
+    valid = ~np.isnan(values)
+    sums = np.cumsum(np.where(valid, values, 0.0))
+    counts = np.cumsum(valid)
+    sums[window:] = sums[window:] - sums[:-window]
+    counts[window:] = counts[window:] - counts[:-window]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def ratio_outliers(prices, reference):
+    """Flag prices below OUTLIER_LOW_RATIO or above OUTLIER_HIGH_RATIO times the reference"""
+    prices = np.asarray(prices, dtype=np.float64)
+    return (prices < OUTLIER_LOW_RATIO * reference) | (prices > OUTLIER_HIGH_RATIO * reference)
+
+
+def detect_outliers(prices, threshold=5.0):
+    """Flag prices far from the median using the median absolute deviation"""
+    prices = np.asarray(prices, dtype=np.float64)
+    if prices.size == 0:
+        return np.zeros(0, dtype=bool)
+    median = np.median(prices)
+    # Floor the deviation so a run of identical prices doesn't flag every price change
+    mad = max(np.median(np.abs(prices - median)) * 1.4826, MAD_FLOOR * median)
+    return ratio_outliers(prices, median) | (np.abs(prices - median) / mad > threshold)
+
+
+def store_report(history, product, store, days=90, window=7):
+    """Rolling statistics of a store computed from the daily rollup"""
+    minimum, average = history.daily_series(product, store, days)
+    rolling_min = rolling(minimum, window, np.nanmin)
+    rolling_median = rolling(average, window, np.nanmedian)
+    ma = moving_average(average, window)
+    seen = ~np.isnan(minimum)
+    last_price = minimum[seen][-1] if seen.any() else None
+    return {
+        'store': store,
+        'last_daily_min': None if last_price is None else last_price / 100,
+        f'rolling_min_{window}d': None if np.isnan(rolling_min[-1]) else rolling_min[-1] / 100,
+        f'rolling_median_{window}d': None if np.isnan(rolling_median[-1]) else rolling_median[-1] / 100,
+        f'moving_average_{window}d': None if np.isnan(ma[-1]) else ma[-1] / 100,
+        f'lowest_{days}d': None if not seen.any() else float(np.nanmin(minimum)) / 100,
+        f'is_lowest_{days}d': bool(last_price is not None and last_price <= np.nanmin(minimum)),
+    }
+
+
+def record_result_files(history, files=None):
+    """Add the JSON files written by the scrapers to the history"""
+    added = 0
+    for filename in files or STORE_FILES:
+        if not os.path.exists(filename):
+            continue
+        added += history.add_offers(read_json(filename, STORE_FILES.get(os.path.basename(filename))))
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Histórico e estatísticas de preços')
+    parser.add_argument('command', choices=['record', 'report'])
+    parser.add_argument('--db', default='historico_precos.db')
+    parser.add_argument('--product', default='galaxy-a05s-128gb-6gb')
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--window', type=int, default=7)
+    parser.add_argument('files', nargs='*')
+    args = parser.parse_args()
+
+    history = PriceHistory(args.db)
+    if args.command == 'record':
+        print(f"{record_result_files(history, args.files)} observações adicionadas ao histórico")
+    else:
+        for store in history.stores(args.product):
+            print(json.dumps(store_report(history, args.product, store, args.days, args.window), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+import re
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from bs4 import BeautifulSoup
+
+from http_client import HttpClient
+from profiling import profiler
+
+TARGET_STORAGE_GB = 128
+TARGET_RAM_GB = 6
+
+# Verdicts are stable for a listing, but a page we could not read is retried sooner
+VERDICT_TTL = 30 * 86400
+UNKNOWN_TTL = 86400
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'pt-BR,pt;q=0.9,en-US;q=0.8,en;q=0.7',
+}
+
+STORAGE_PATTERN = re.compile(r'(?:armazenamento|mem[óo]ria\s*interna|capacidade(?:\s*de\s*armazenamento)?)\s*[:\-]?\s*(\d+)\s*gb')
+RAM_PATTERN = re.compile(r'(?:mem[óo]ria\s*ram|ram)\s*[:\-]?\s*(\d+)\s*gb')
+CONDITION_PATTERN = re.compile(r'condi[çc][ãa]o(?:\s*do\s*item)?\s*[:\-]?\s*(novo|nova|usado|usada|recondicionado|recondicionada)')
+
+# Title words of refurbished or second-hand listings, excluded by every store
+EXCLUDED_WORDS = ('recondicionado', 'recond', 'usado', 'segunda m')
+SIZE_PATTERN = re.compile(r'(\d+)\s*(?:gb|tb)')
+
+# Query parameters that only track where the click came from; anything else may identify the product
+TRACKING_PARAMETERS = {'gclid', 'fbclid', 'msclkid', 'tracking_id', 'position', 'search_layout', 'sid',
+                       'polycard_client', 'is_advertising', 'ad_domain', 'ad_position', 'ad_click_id'}
+
+
+def title_has_target_specs(title):
+    """True if the title itself states 128GB storage and 6GB RAM"""
+    title_lower = title.lower()
+    return '128' in title_lower and ('6gb' in title_lower or '6 gb' in title_lower)
+
+
+def is_target_model(title, excluded=()):
+    """True if the title names a new Galaxy A05s, whatever its specs; excluded adds store-specific words"""
+    title_lower = title.lower()
+    return ('galaxy' in title_lower and 'a05s' in title_lower and
+            not any(word in title_lower for word in EXCLUDED_WORDS + tuple(excluded)))
+
+
+def title_is_ambiguous(title):
+    """True if the title lacks the target specs without contradicting them (e.g. no sizes, or only 128GB)"""
+    if title_has_target_specs(title):
+        return False
+    sizes = SIZE_PATTERN.findall(title.lower())
+    return all(int(size) in (TARGET_STORAGE_GB, TARGET_RAM_GB) for size in sizes)
+
+
+def verify_offers(verifier, offers, store, keep_unknown=False):
+    """Run the verifier (if any) over a page of offers, profiled as the store's 'verify' phase"""
+    if not verifier or not offers:
+        return offers
+    with profiler.phase(store, 'verify'):
+        return verifier.filter(offers, keep_unknown=keep_unknown)
+
+
+def canonical_url(link):
+    """Product URL without tracking parameters, fragment or trailing slash, so tracking variants share a cache entry"""
+    parts = urlsplit(link)
+    # Some links (e.g. Mercado Livre's sponsored click1 redirects) carry the product in the query
+    query = sorted((name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if name.lower() not in TRACKING_PARAMETERS and not name.lower().startswith('utm_'))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip('/'), urlencode(query), ''))
+
+
+def read_specs(content):
+    """Read storage, RAM (GB) and condition from a product page"""
+    soup = BeautifulSoup(content, 'html.parser')
+    # Spec tables ("label: value" lines) win; the page text is only a fallback, since it also
+    # holds related-product carousels with other models' specs
+    lines = []
+    for row in soup.find_all('tr'):
+        cells = [cell.get_text(' ', strip=True) for cell in row.find_all(['th', 'td'])]
+        if len(cells) >= 2:
+            lines.append(f"{cells[0]}: {cells[1]}")
+    for term in soup.find_all('dt'):
+        definition = term.find_next_sibling('dd')
+        if definition:
+            lines.append(f"{term.get_text(' ', strip=True)}: {definition.get_text(' ', strip=True)}")
+    spec_text = '\n'.join(lines).lower()
+    page_text = None
+    found = []
+    for pattern in (STORAGE_PATTERN, RAM_PATTERN, CONDITION_PATTERN):
+        match = pattern.search(spec_text)
+        if match is None:
+            if page_text is None:
+                page_text = soup.get_text('\n', strip=True).lower()
+            match = pattern.search(page_text)
+        found.append(match.group(1) if match else None)
+    storage, ram, condition = found
+    return (int(storage) if storage else None,
+            int(ram) if ram else None,
+            condition)
+
+
+def verdict_for(storage_gb, ram_gb, condition):
+    """'match', 'mismatch' or 'unknown' for the specs read from a product page"""
+    if condition and not condition.startswith('nov'):
+        return 'mismatch'
+    if storage_gb is None or ram_gb is None:
+        return 'unknown'
+    if storage_gb == TARGET_STORAGE_GB and ram_gb == TARGET_RAM_GB:
+        return 'match'
+    return 'mismatch'
+
+
+class ProductVerifier:
+    """Checks ambiguous listings against their product page, with a per-URL verdict cache"""
+
+    def __init__(self, cache_file='verificacoes.db', max_workers=4, client=None):
+        self.max_workers = max_workers
+        self.client = client or HttpClient(HEADERS)
+        self.conn = sqlite3.connect(cache_file)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS verdicts (
+                url TEXT PRIMARY KEY,
+                verdict TEXT NOT NULL,
+                storage_gb INTEGER,
+                ram_gb INTEGER,
+                condition TEXT,
+                checked_at INTEGER NOT NULL
+            )
+        ''')
+
+    def cached_verdict(self, url, now):
+        row = self.conn.execute('SELECT verdict, checked_at FROM verdicts WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return None
+        verdict, checked_at = row
+        ttl = UNKNOWN_TTL if verdict == 'unknown' else VERDICT_TTL
+        return verdict if now - checked_at < ttl else None
+
+    def check_page(self, url):
+        """Fetch one product page and return (storage_gb, ram_gb, condition)"""
+        try:
+            return read_specs(self.client.get_content(url))
+        except requests.RequestException as e:
+            print(f"Error fetching product page {url}: {e}")
+            return None, None, None
+
+    def verify(self, links):
+        """Return the verdict of each link, fetching uncached pages concurrently"""
+        now = int(time.time())
+        urls = {link: canonical_url(link) for link in links if link and link.startswith('http')}
+        verdicts = {}
+        pending = []
+        for url in set(urls.values()):
+            verdict = self.cached_verdict(url, now)
+            if verdict is None:
+                pending.append(url)
+            else:
+                verdicts[url] = verdict
+
+        if pending:
+            # The pool bounds how many product pages are requested at the same time
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                specs = list(pool.map(self.check_page, pending))
+            rows = []
+            for url, (storage_gb, ram_gb, condition) in zip(pending, specs):
+                verdicts[url] = verdict_for(storage_gb, ram_gb, condition)
+                rows.append((url, verdicts[url], storage_gb, ram_gb, condition, now))
+            self.conn.executemany('INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?, ?, ?)', rows)
+            self.conn.commit()
+
+        return {link: verdicts.get(url, 'unknown') for link, url in urls.items()}
+
+    def filter(self, offers, keep_unknown=False):
+        """Keep offers whose title states the target specs or whose product page confirms them
+
+        Titles with other sizes (64GB, 4GB...) contradict the target and are dropped without a fetch.
+        """
+        ambiguous = [offer for offer in offers if title_is_ambiguous(offer.title)]
+        verdicts = self.verify([offer.link for offer in ambiguous]) if ambiguous else {}
+        kept = []
+        confirmed = 0
+        for offer in offers:
+            if title_has_target_specs(offer.title):
+                kept.append(offer)
+            elif title_is_ambiguous(offer.title):
+                verdict = verdicts.get(offer.link, 'unknown')
+                if verdict == 'match' or (verdict == 'unknown' and keep_unknown):
+                    kept.append(offer)
+                    confirmed += 1
+        if ambiguous:
+            print(f"Verificação: {len(ambiguous)} anúncios ambíguos, {confirmed} mantidos")
+        return kept
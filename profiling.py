@@ -0,0 +1,120 @@
+import cProfile
+import os
+import pstats
+import sys
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+TOP_ALLOCATIONS = 10
+
+
+class Profiler:
+    """CPU (cProfile) and memory (tracemalloc) profiles of each store and scraping phase"""
+
+    def __init__(self):
+        self.enabled = False
+        self.output_dir = 'perfis'
+        self.profiles = {}
+        self.allocations = {}
+
+    def enable(self, output_dir='perfis'):
+        """Turn profiling on; phases are no-ops until this is called"""
+        self.enabled = True
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+
+    def phase(self, store, name):
+        """Context manager profiling one phase ('fetch', 'parse', 'extract', 'output', ...) of a store"""
+        if not self.enabled:
+            return nullcontext()
+        return self._profile_phase(store, name)
+
+    @contextmanager
+    def _profile_phase(self, store, name):
+        key = (store, name)
+        # One profile per phase, enabled again on every call so repeated pages accumulate
+        profile = self.profiles.setdefault(key, cProfile.Profile())
+        before = tracemalloc.take_snapshot()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            # Leave out the allocations made by the profiler itself
+            after = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+            ])
+            sites = self.allocations.setdefault(key, {})
+            for stat in after.compare_to(before, 'lineno'):
+                if stat.size_diff > 0:
+                    site = stat.traceback[0]
+                    sites[(site.filename, site.lineno)] = sites.get((site.filename, site.lineno), 0) + stat.size_diff
+
+    def write_reports(self):
+        """Write pstats and collapsed-stack files for every phase and print the top allocation sites"""
+        if not self.enabled:
+            return
+        for (store, name), profile in self.profiles.items():
+            base = os.path.join(self.output_dir, f"{store.lower().replace(' ', '_')}_{name}")
+            stats = pstats.Stats(profile)
+            stats.dump_stats(base + '.pstats')
+            with open(base + '.collapsed', 'w', encoding='utf-8') as f:
+                for stack, microseconds in collapsed_stacks(stats):
+                    f.write(f"{stack} {microseconds}\n")
+
+            print(f"\n[perfil] {store} / {name}: {stats.total_tt:.3f}s de CPU -> {base}.pstats, {base}.collapsed")
+            sites = sorted(self.allocations.get((store, name), {}).items(), key=lambda item: item[1], reverse=True)
+            for (filename, lineno), size in sites[:TOP_ALLOCATIONS]:
+                print(f"    {size / 1024:10.1f} KiB  {filename}:{lineno}")
+
+
+def function_label(func):
+    filename, lineno, name = func
+    return f"{name} ({os.path.basename(filename)}:{lineno})" if lineno else name
+
+
+def collapsed_stacks(stats, max_depth=64):
+    """Approximate collapsed stacks ('a;b;c microseconds') from pstats call-graph data
+
+    cProfile only records caller -> callee edges, so the self time of each function
+    is split among its call paths in proportion to the time spent under each caller.
+    """
+    entries = stats.stats
+    totals = {}
+
+    def walk(func, suffix, seconds, depth, seen):
+        # Paths below a microsecond would not show up in the flamegraph anyway
+        if seconds < 1e-6:
+            return
+        callers = entries[func][4]
+        path = [function_label(func)] + suffix
+        parents = [caller for caller in callers if caller in entries and caller not in seen]
+        if not parents or depth >= max_depth:
+            stack = ';'.join(path)
+            totals[stack] = totals.get(stack, 0) + seconds
+            return
+        caller_time = sum(callers[caller][3] for caller in parents)
+        for caller in parents:
+            share = callers[caller][3] / caller_time if caller_time else 1 / len(parents)
+            walk(caller, path, seconds * share, depth + 1, seen | {caller})
+
+    for func, (cc, nc, tt, ct, callers) in entries.items():
+        if tt > 0:
+            walk(func, [], tt, 0, {func})
+
+    for stack, seconds in sorted(totals.items()):
+        microseconds = int(seconds * 1_000_000)
+        if microseconds > 0:
+            yield stack, microseconds
+
+
+def profile_requested():
+    """True if --profile was passed on the command line"""
+    return '--profile' in sys.argv
+
+
+# Shared by all scrapers of a process; enabled by --profile
+profiler = Profiler()
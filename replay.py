@@ -0,0 +1,104 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+
+
+class Archive:
+    """Recorded responses in a SQLite file, zlib-compressed and indexed by key (usually the URL)"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        # Product pages are fetched from a thread pool (see product_verification), so the
+        # connection is shared between threads and every access goes through the lock
+        self.conn = sqlite3.connect(filename, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                recorded_at INTEGER NOT NULL
+            )
+        ''')
+        # Replays read the same keys over and over, so keep them decompressed in memory
+        self.cache = {}
+
+    def put(self, key, body):
+        """Store a response body (bytes or str), replacing an earlier recording of the same key"""
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?)',
+                              (key, zlib.compress(body, 6), int(time.time())))
+            self.conn.commit()
+            self.cache[key] = body
+
+    def get(self, key):
+        """Return the recorded body as bytes, or None if the key was never recorded"""
+        with self.lock:
+            if key not in self.cache:
+                row = self.conn.execute('SELECT body FROM responses WHERE key = ?', (key,)).fetchone()
+                if row is None:
+                    return None
+                self.cache[key] = zlib.decompress(row[0])
+            return self.cache[key]
+
+    def put_json(self, key, value):
+        self.put(key, json.dumps(value, ensure_ascii=False))
+
+    def get_json(self, key):
+        body = self.get(key)
+        return None if body is None else json.loads(body)
+
+
+class Transport:
+    """Record/replay switch shared by the scrapers of a process"""
+
+    def __init__(self):
+        self.mode = None
+        self.archive = None
+
+    def record(self, filename):
+        self.mode = 'record'
+        self.archive = Archive(filename)
+
+    def replay(self, filename):
+        self.mode = 'replay'
+        self.archive = Archive(filename)
+
+    @property
+    def recording(self):
+        return self.mode == 'record'
+
+    @property
+    def replaying(self):
+        return self.mode == 'replay'
+
+    def configure_from_argv(self, argv=None):
+        """Enable recording or replay from --record FILE / --replay FILE on the command line"""
+        argv = sys.argv if argv is None else argv
+        for flag, setup in (('--record', self.record), ('--replay', self.replay)):
+            if flag in argv:
+                index = argv.index(flag)
+                if index + 1 >= len(argv):
+                    raise SystemExit(f"{flag} precisa do caminho do arquivo de gravação")
+                setup(argv[index + 1])
+
+    def output_path(self, filename):
+        """Where a result file goes: next to the archive when replaying, so live results stay untouched"""
+        if not self.replaying:
+            return filename
+        return f"{os.path.splitext(self.archive.filename)[0]}.{os.path.basename(filename)}"
+
+    def argv(self):
+        """Command line flags that reproduce the current mode in a child process"""
+        if self.mode is None:
+            return []
+        return [f'--{self.mode}', self.archive.filename]
+
+
+# Shared by all scrapers of a process; configured by --record/--replay
+transport = Transport()
@@ -1,12 +1,18 @@
 import subprocess
 import sys
 import os
+from profiling import profile_requested, profiler
+from replay import transport
 
 def run_scraper(scraper_file, store_name):
     """Run a scraper file and return the results"""
     print(f"\nExecutando o scraper para {store_name}...")
     try:
-        result = subprocess.run([sys.executable, scraper_file], 
+        # Forward --profile, --verify and --record/--replay to each scraper
+        args = [sys.executable, scraper_file] + (['--profile'] if profile_requested() else []) + transport.argv()
+        if '--verify' in sys.argv:
+            args.append('--verify')
+        result = subprocess.run(args, 
                                 capture_output=True, 
                                 text=True, 
                                 timeout=120)  # 2 minute timeout
@@ -23,6 +29,10 @@ def run_scraper(scraper_file, store_name):
         print(f"Ocorreu um erro ao executar o scraper para {store_name}: {e}")
 
 def main():
+    if profile_requested():
+        profiler.enable()
+    transport.configure_from_argv()
+    
     print("Iniciando monitoramento de preços do Samsung Galaxy A05s em todas as lojas...")
     
     # Run Mercado Livre scraper
@@ -34,8 +44,29 @@ def main():
     # Run Kabum scraper
     run_scraper('kabum_scraper.py', 'Kabum')
     
+    # Replayed offers are stamped with the current time, so they must not reach the
+    # history or trigger alerts
+    if transport.replaying:
+        print("\nReprodução offline: histórico de preços e alertas não foram atualizados.")
+    else:
+        # Add the new results to the price history and its daily/hourly rollups
+        from price_analytics import PriceHistory, record_result_files
+        with profiler.phase('Todas as lojas', 'history'):
+            added = record_result_files(PriceHistory())
+        print(f"\n{added} observações adicionadas ao histórico de preços.")
+    
+        # Check price alert rules against the new results when a webhook is configured
+        webhook_url = os.environ.get('ALERT_WEBHOOK_URL')
+        if webhook_url and os.path.exists('regras_alerta.json'):
+            from price_alerts import check_result_files
+            with profiler.phase('Todas as lojas', 'alerts'):
+                alerts = check_result_files('regras_alerta.json', webhook_url)
+            print(f"\n{len(alerts)} alertas de preço enviados.")
+    
     print("\nProcesso de monitoramento concluído!")
     print("Verifique os arquivos CSV e JSON gerados para cada loja.")
+    
+    profiler.write_reports()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
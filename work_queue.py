@@ -0,0 +1,454 @@
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from datetime import datetime
+
+# Stores that workers know how to scrape, with the queries enqueued for each one
+STORE_QUERIES = {
+    'Mercado Livre': ['samsung galaxy a05s', 'galaxy a05s', 'samsung a05s', 'celular samsung galaxy a05s'],
+    'Magazine Luiza': ['samsung galaxy a05s', 'samsung a05s', 'galaxy a05s'],
+    'Kabum': ['samsung galaxy a05s', 'samsung a05s', 'galaxy a05s', 'celular samsung a05s'],
+}
+
+
+class Job:
+    """One unit of scraping work: a single results page of a query in a store"""
+
+    def __init__(self, store, query, page=1, job_id=None, attempts=0):
+        self.store = store
+        self.query = query
+        self.page = page
+        self.job_id = job_id or uuid.uuid4().hex
+        self.attempts = attempts
+        # Set by lease(); ack() and fail() only apply while this lease is still the current one
+        self.lease_token = None
+
+    def to_json(self):
+        return json.dumps({'job_id': self.job_id, 'store': self.store, 'query': self.query,
+                           'page': self.page, 'attempts': self.attempts})
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(**json.loads(data))
+
+    def __repr__(self):
+        return f"Job({self.store!r}, {self.query!r}, page={self.page})"
+
+
+class SQLiteQueue:
+    """Job queue stored in a SQLite file, shared by the worker processes of one host"""
+
+    def __init__(self, filename='fila_scraping.db', visibility_timeout=300, max_attempts=3):
+        self.filename = filename
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.conn = sqlite3.connect(filename, timeout=30, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                store TEXT NOT NULL,
+                query TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_until REAL,
+                lease_token TEXT,
+                last_error TEXT
+            )
+        ''')
+        # Queue files created before lease tokens existed
+        if 'lease_token' not in [row[1] for row in self.conn.execute('PRAGMA table_info(jobs)')]:
+            self.conn.execute('ALTER TABLE jobs ADD COLUMN lease_token TEXT')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_until)')
+
+    def put(self, job):
+        """Add a job to the queue"""
+        self.conn.execute('INSERT OR IGNORE INTO jobs (job_id, store, query, page) VALUES (?, ?, ?, ?)',
+                          (job.job_id, job.store, job.query, job.page))
+
+    def lease(self):
+        """Take the next available job, hiding it from other workers until its lease expires"""
+        now = time.time()
+        token = uuid.uuid4().hex
+        # BEGIN IMMEDIATE takes the write lock, so two workers never lease the same job
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            # A job whose worker hung or died on its last attempt is not leased again
+            self.conn.execute('''
+                UPDATE jobs SET status = 'failed', lease_until = NULL, lease_token = NULL,
+                    last_error = 'lease expired on the last attempt'
+                WHERE status = 'leased' AND lease_until < ? AND attempts >= ?
+            ''', (now, self.max_attempts))
+            row = self.conn.execute('''
+                SELECT job_id, store, query, page, attempts FROM jobs
+                WHERE status = 'pending' OR (status = 'leased' AND lease_until < ?)
+                ORDER BY rowid LIMIT 1
+            ''', (now,)).fetchone()
+            if row is None:
+                self.conn.execute('COMMIT')
+                return None
+            self.conn.execute('''
+                UPDATE jobs SET status = 'leased', lease_until = ?, lease_token = ?, attempts = attempts + 1
+                WHERE job_id = ?
+            ''', (now + self.visibility_timeout, token, row[0]))
+            self.conn.execute('COMMIT')
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+        job = Job(row[1], row[2], row[3], job_id=row[0], attempts=row[4] + 1)
+        job.lease_token = token
+        return job
+
+    def ack(self, job):
+        """Mark a leased job as done; False if the lease expired and the job went to another worker"""
+        cursor = self.conn.execute('''
+            UPDATE jobs SET status = 'done', lease_until = NULL, lease_token = NULL
+            WHERE job_id = ? AND status = 'leased' AND lease_token = ?
+        ''', (job.job_id, job.lease_token))
+        return cursor.rowcount == 1
+
+    def fail(self, job, error):
+        """Return a failed job to the queue, or give up on it after max_attempts (False if the lease was lost)"""
+        status = 'failed' if job.attempts >= self.max_attempts else 'pending'
+        cursor = self.conn.execute('''
+            UPDATE jobs SET status = ?, lease_until = NULL, lease_token = NULL, last_error = ?
+            WHERE job_id = ? AND status = 'leased' AND lease_token = ?
+        ''', (status, str(error), job.job_id, job.lease_token))
+        return cursor.rowcount == 1
+
+    def counts(self):
+        """Return the number of jobs in each status"""
+        return dict(self.conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+
+
+# Atomically requeue expired leases (or fail them after max_attempts) and move the next
+# pending job into the lease set under a new lease token
+# KEYS: pending, leases, attempts, tokens, failed; ARGV: now, lease_until, token, max_attempts
+REDIS_LEASE_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for _, job_id in ipairs(expired) do
+    redis.call('ZREM', KEYS[2], job_id)
+    redis.call('HDEL', KEYS[4], job_id)
+    if tonumber(redis.call('HGET', KEYS[3], job_id) or 0) >= tonumber(ARGV[4]) then
+        redis.call('HSET', KEYS[5], job_id, 'lease expired on the last attempt')
+    else
+        redis.call('RPUSH', KEYS[1], job_id)
+    end
+end
+local job_id = redis.call('LPOP', KEYS[1])
+if not job_id then
+    return nil
+end
+redis.call('ZADD', KEYS[2], ARGV[2], job_id)
+redis.call('HINCRBY', KEYS[3], job_id, 1)
+redis.call('HSET', KEYS[4], job_id, ARGV[3])
+return job_id
+"""
+
+# Finish a job only while the caller still holds its lease
+# KEYS: leases, tokens, done; ARGV: job_id, token
+REDIS_ACK_SCRIPT = """
+if redis.call('HGET', KEYS[2], ARGV[1]) ~= ARGV[2] then
+    return 0
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[2], ARGV[1])
+redis.call('SADD', KEYS[3], ARGV[1])
+return 1
+"""
+
+# Requeue (or fail, when give_up is 1) a job only while the caller still holds its lease
+# KEYS: leases, tokens, pending, failed; ARGV: job_id, token, give_up, error
+REDIS_FAIL_SCRIPT = """
+if redis.call('HGET', KEYS[2], ARGV[1]) ~= ARGV[2] then
+    return 0
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[2], ARGV[1])
+if ARGV[3] == '1' then
+    redis.call('HSET', KEYS[4], ARGV[1], ARGV[4])
+else
+    redis.call('RPUSH', KEYS[3], ARGV[1])
+end
+return 1
+"""
+
+
+class RedisQueue:
+    """Job queue stored in Redis, shared by workers on any number of hosts"""
+
+    def __init__(self, url='redis://localhost:6379/0', name='fila_scraping', visibility_timeout=300, max_attempts=3):
+        import redis
+
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.pending_key = f'{name}:pending'
+        self.leases_key = f'{name}:leases'
+        self.attempts_key = f'{name}:attempts'
+        self.tokens_key = f'{name}:tokens'
+        self.jobs_key = f'{name}:jobs'
+        self.failed_key = f'{name}:failed'
+        self.done_key = f'{name}:done'
+        self.lease_script = self.client.register_script(REDIS_LEASE_SCRIPT)
+        self.ack_script = self.client.register_script(REDIS_ACK_SCRIPT)
+        self.fail_script = self.client.register_script(REDIS_FAIL_SCRIPT)
+
+    def put(self, job):
+        """Add a job to the queue"""
+        if self.client.hsetnx(self.jobs_key, job.job_id, job.to_json()):
+            self.client.rpush(self.pending_key, job.job_id)
+
+    def lease(self):
+        """Take the next available job, hiding it from other workers until its lease expires"""
+        now = time.time()
+        token = uuid.uuid4().hex
+        job_id = self.lease_script(keys=[self.pending_key, self.leases_key, self.attempts_key,
+                                         self.tokens_key, self.failed_key],
+                                   args=[now, now + self.visibility_timeout, token, self.max_attempts])
+        if job_id is None:
+            return None
+        job = Job.from_json(self.client.hget(self.jobs_key, job_id))
+        job.attempts = int(self.client.hget(self.attempts_key, job_id) or 1)
+        job.lease_token = token
+        return job
+
+    def ack(self, job):
+        """Mark a leased job as done; False if the lease expired and the job went to another worker"""
+        return bool(self.ack_script(keys=[self.leases_key, self.tokens_key, self.done_key],
+                                    args=[job.job_id, job.lease_token]))
+
+    def fail(self, job, error):
+        """Return a failed job to the queue, or give up on it after max_attempts (False if the lease was lost)"""
+        give_up = 1 if job.attempts >= self.max_attempts else 0
+        return bool(self.fail_script(keys=[self.leases_key, self.tokens_key, self.pending_key, self.failed_key],
+                                     args=[job.job_id, job.lease_token, give_up, str(error)]))
+
+    def counts(self):
+        """Return the number of jobs in each status"""
+        return {
+            'pending': self.client.llen(self.pending_key),
+            'leased': self.client.zcard(self.leases_key),
+            'done': self.client.scard(self.done_key),
+            'failed': self.client.hlen(self.failed_key),
+        }
+
+
+class SQLiteResultSink:
+    """Stores the products found by the workers in a shared SQLite table"""
+
+    def __init__(self, filename='resultados_scraping.db'):
+        self.conn = sqlite3.connect(filename, timeout=30, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS results (
+                job_id TEXT NOT NULL,
+                query TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                ts INTEGER NOT NULL,
+                store TEXT NOT NULL,
+                product TEXT NOT NULL,
+                title TEXT,
+                price_cents INTEGER,
+                link TEXT
+            )
+        ''')
+
+    def write(self, job, products):
+        """Store the products found by a job"""
+        # Replace earlier results of the same job so a retried job is not counted twice
+        self.conn.execute('BEGIN IMMEDIATE')
+        self.conn.execute('DELETE FROM results WHERE job_id = ?', (job.job_id,))
+        self.conn.executemany('INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', [
+            (job.job_id, job.query, job.page) + offer.to_sqlite_row() for offer in products
+        ])
+        self.conn.execute('COMMIT')
+
+
+class RedisResultSink:
+    """Pushes the products found by the workers to a shared Redis list"""
+
+    def __init__(self, url='redis://localhost:6379/0', key='resultados_scraping'):
+        import redis
+
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.key = key
+
+    def write(self, job, products):
+        """Store the products found by a job"""
+        if products:
+            self.client.rpush(self.key, *[
+                json.dumps({'job_id': job.job_id, 'query': job.query, 'page': job.page, **offer.to_dict()},
+                           ensure_ascii=False)
+                for offer in products
+            ])
+
+
+class Worker:
+    """Leases jobs from a queue, runs the matching scraper and sends the products to a sink"""
+
+    def __init__(self, queue, sink, poll_interval=5, idle_exit=True, verifier=None, history=None):
+        self.queue = queue
+        self.sink = sink
+        # Optional PriceHistory; the volatility estimates behind --budget are read from it
+        self.history = history
+        # Passed to the scrapers to check listings without specs in the title
+        self.verifier = verifier
+        self.poll_interval = poll_interval
+        self.idle_exit = idle_exit
+        self.worker_id = f'{socket.gethostname()}-{os.getpid()}'
+        # Scrapers are created on first use and reused for every job of the same store
+        self.scrapers = {}
+
+    def get_scraper(self, store):
+        """Return the scraper for a store, creating it the first time"""
+        if store not in self.scrapers:
+            if store == 'Mercado Livre':
+                from mercado_livre_scraper import MercadoLivreScraper
+                self.scrapers[store] = MercadoLivreScraper(verifier=self.verifier)
+            elif store == 'Magazine Luiza':
+                from magazine_luiza_scraper import MagazineLuizaScraper
+                self.scrapers[store] = MagazineLuizaScraper(verifier=self.verifier)
+            elif store == 'Kabum':
+                from kabum_scraper import KabumScraper
+                self.scrapers[store] = KabumScraper(verifier=self.verifier)
+            else:
+                raise ValueError(f"Unknown store: {store}")
+        return self.scrapers[store]
+
+    def run_job(self, job):
+        """Scrape the page described by a job and return its products"""
+        scraper = self.get_scraper(job.store)
+        if job.store == 'Mercado Livre':
+            html_content = scraper.search_products(job.query, page=job.page)
+            if html_content is None:
+                raise RuntimeError("Could not fetch Mercado Livre page")
+            return scraper.parse_product_listings(html_content)
+        if job.store == 'Magazine Luiza':
+            search_url = f"https://www.magazineluiza.com.br/busca/{job.query.replace(' ', '+')}/"
+            if job.page > 1:
+                search_url += f"?page={job.page}"
+            return scraper.scrape_search_page(search_url)
+        return scraper.scrape_term(job.query, page=job.page)
+
+    def run(self):
+        """Process jobs until the queue is empty (or forever when idle_exit is False)"""
+        processed = 0
+        while True:
+            job = self.queue.lease()
+            if job is None:
+                if self.idle_exit:
+                    break
+                time.sleep(self.poll_interval)
+                continue
+
+            print(f"[{self.worker_id}] Processando {job} (tentativa {job.attempts})")
+            try:
+                products = self.run_job(job)
+                self.sink.write(job, products)
+                if not self.queue.ack(job):
+                    print(f"[{self.worker_id}] Lease of {job} expired before it finished; another worker owns it now")
+                    continue
+                if self.history:
+                    # The job is done either way; a busy history file only loses these observations
+                    try:
+                        self.history.add_offers(products)
+                    except sqlite3.Error as e:
+                        print(f"[{self.worker_id}] Could not add {job} to the price history: {e}")
+                processed += 1
+            except Exception as e:
+                print(f"[{self.worker_id}] Error processing {job}: {e}")
+                if not self.queue.fail(job, e):
+                    print(f"[{self.worker_id}] Lease of {job} expired before it failed; another worker owns it now")
+
+        for scraper in self.scrapers.values():
+            if hasattr(scraper, 'close'):
+                scraper.close()
+        return processed
+
+
+def make_queue(args):
+    """Create the queue backend selected on the command line"""
+    if args.backend == 'redis':
+        return RedisQueue(args.redis_url, visibility_timeout=args.visibility_timeout, max_attempts=args.max_attempts)
+    return SQLiteQueue(args.queue_file, visibility_timeout=args.visibility_timeout, max_attempts=args.max_attempts)
+
+
+def make_sink(args):
+    """Create the result sink selected on the command line"""
+    if args.backend == 'redis':
+        return RedisResultSink(args.redis_url)
+    return SQLiteResultSink(args.results_file)
+
+
+def run_worker(args):
+    """Entry point of a worker process"""
+    verifier = None
+    if args.verify:
+        from product_verification import ProductVerifier
+        verifier = ProductVerifier(args.verify_cache, max_workers=args.verify_workers)
+    from price_analytics import PriceHistory
+    worker = Worker(make_queue(args), make_sink(args), idle_exit=not args.forever, verifier=verifier,
+                    history=PriceHistory(args.history_file))
+    return worker.run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fila de trabalhos de scraping compartilhada entre workers')
+    parser.add_argument('command', choices=['enqueue', 'worker', 'status'])
+    parser.add_argument('--backend', choices=['sqlite', 'redis'], default='sqlite')
+    parser.add_argument('--queue-file', default='fila_scraping.db')
+    parser.add_argument('--results-file', default='resultados_scraping.db')
+    parser.add_argument('--redis-url', default='redis://localhost:6379/0')
+    parser.add_argument('--visibility-timeout', type=int, default=300)
+    parser.add_argument('--max-attempts', type=int, default=3)
+    parser.add_argument('--stores', nargs='+', default=list(STORE_QUERIES))
+    parser.add_argument('--pages', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--forever', action='store_true', help='keep polling when the queue is empty')
+    parser.add_argument('--verify', action='store_true', help='check listings without specs in the title against their product page')
+    parser.add_argument('--verify-cache', default='verificacoes.db')
+    parser.add_argument('--verify-workers', type=int, default=4)
+    parser.add_argument('--history-file', default='historico_precos.db',
+                        help='price history fed by the workers and read by --budget')
+    parser.add_argument('--budget', type=float,
+                        help='daily request budget; only enqueue stores that are due according to their price volatility')
+    args = parser.parse_args()
+
+    if args.command == 'enqueue':
+        queue = make_queue(args)
+        stores = args.stores
+        if args.budget:
+            from polling_budget import PollSchedule, plan
+            _, _, allocation = plan({store: STORE_QUERIES[store] for store in stores}, args.budget, args.pages,
+                                    history_file=args.history_file)
+            schedule = PollSchedule()
+            stores = schedule.due(allocation)
+            schedule.mark_polled(stores)
+        count = 0
+        for store in stores:
+            for query in STORE_QUERIES[store]:
+                for page in range(1, args.pages + 1):
+                    queue.put(Job(store, query, page))
+                    count += 1
+        print(f"{count} trabalhos adicionados à fila em {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    elif args.command == 'worker':
+        # Each worker is its own process with its own scrapers and queue connection
+        if args.workers == 1:
+            processed = run_worker(args)
+        else:
+            with multiprocessing.Pool(args.workers) as pool:
+                processed = sum(pool.map(run_worker, [args] * args.workers))
+        print(f"{processed} trabalhos concluídos")
+    else:
+        print(make_queue(args).counts())
+
+
+if __name__ == "__main__":
+    main()